@@ -1,12 +1,22 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from PIL import Image
 import io
+import json
 import base64
 from src.detector import RefinedUIDetector
+from src.neighbors import calculate_neighbors
+from src.hierarchy import find_contained
+from src.blobstore import create_blob_store, hash_crop_pixels
+from src.scheduler import GPUJobScheduler, SchedulerBusy
+from src.telemetry import metrics_response, span
+from config.settings import BLOB_STORE, SCHEDULER_CONFIG
 
 router = APIRouter()
 detector = RefinedUIDetector()
+blob_store = create_blob_store(BLOB_STORE)
+scheduler = GPUJobScheduler(**SCHEDULER_CONFIG)
 
 class IDGenerator:
    def __init__(self):
@@ -19,23 +29,18 @@ class IDGenerator:
        self.counter += 1
        return f"elem{self.counter}"
 
-id_generator = IDGenerator()
-
-def is_contained_within(box1, box2):
-   return (box1[0] >= box2[0] and box1[1] >= box2[1] and 
-           box1[2] <= box2[2] and box1[3] <= box2[3])
-
-def find_children(element, all_elements):
-   children = []
-   for potential_child in all_elements:
-       if potential_child['id'] != element['id']:
-           if is_contained_within(potential_child['box'], element['box']):
-               children.append(potential_child)
-   return children
+async def schedule_detection(fn, image: Image.Image):
+   """Admit a detection job, answering 429/503 with Retry-After when saturated."""
+   try:
+       return await scheduler.submit(fn, image)
+   except SchedulerBusy as e:
+       raise HTTPException(e.status_code, str(e), headers={"Retry-After": str(e.retry_after)})
 
 def process_hierarchy(elements):
+   # Children are emitted as id references; the elements themselves are already in the section.
+   contained = find_contained(elements)
    for element in elements:
-       children = find_children(element, elements)
+       children = contained[element['id']]
        element['has_children'] = len(children) > 0
        element['children_count'] = len(children)
        if children:
@@ -60,46 +65,6 @@ def get_section_metadata(box: list, image_height: int) -> dict:
        "vertical_position": "top" if y_start < 33 else "middle" if y_start < 66 else "bottom"
    }
 
-def calculate_neighbors(elements: list) -> dict:
-   neighbor_map = {}
-   for i, elem in enumerate(elements):
-       box1 = elem['box']
-       neighbors = {
-           "left": None,
-           "right": None,
-           "above": None,
-           "below": None
-       }
-       
-       for other in elements:
-           if elem['id'] == other['id']:
-               continue
-           box2 = other['box']
-           
-           if (box1[1] < box2[3] and box1[3] > box2[1]):
-               if box2[2] < box1[0]:
-                   if (not neighbors["left"] or 
-                       box1[0] - box2[2] < box1[0] - elements[next(i for i, e in enumerate(elements) if e['id'] == neighbors["left"])]['box'][2]):
-                       neighbors["left"] = other['id']
-               elif box2[0] > box1[2]:
-                   if (not neighbors["right"] or 
-                       box2[0] - box1[2] < elements[next(i for i, e in enumerate(elements) if e['id'] == neighbors["right"])]['box'][0] - box1[2]):
-                       neighbors["right"] = other['id']
-           
-           if (box1[0] < box2[2] and box1[2] > box2[0]):
-               if box2[3] < box1[1]:
-                   if (not neighbors["above"] or 
-                       box1[1] - box2[3] < box1[1] - elements[next(i for i, e in enumerate(elements) if e['id'] == neighbors["above"])]['box'][3]):
-                       neighbors["above"] = other['id']
-               elif box2[1] > box1[3]:
-                   if (not neighbors["below"] or 
-                       box2[1] - box1[3] < elements[next(i for i, e in enumerate(elements) if e['id'] == neighbors["below"])]['box'][1] - box1[3]):
-                       neighbors["below"] = other['id']
-       
-       neighbor_map[elem['id']] = neighbors
-   
-   return neighbor_map
-
 @router.post("/api/mask")
 async def create_mask(file: UploadFile = File(...)):
    if not file.content_type.startswith('image/'):
@@ -108,7 +73,7 @@ async def create_mask(file: UploadFile = File(...)):
    image_data = await file.read()
    image = Image.open(io.BytesIO(image_data))
    
-   ui_detections, text_detections, layout_containers, _ = detector.detect(image)
+   ui_detections, text_detections, layout_containers, _ = await (await schedule_detection(detector.detect, image))
    if not ui_detections and not text_detections:
        raise HTTPException(500, "Processing failed")
        
@@ -132,62 +97,139 @@ async def create_mask(file: UploadFile = File(...)):
        media_type="image/png"
    )
 
+IMAGE_MODES = ("inline", "ref", "none")
+
+def crop_fields(image: Image.Image, box: list, images: str, image_ref: str = None) -> dict:
+   # "ref" and "none" leave cropping to the consumer: from the blob store, or from a screenshot it already has.
+   if images == "inline":
+       return {"image": get_cropped_image_base64(image, box)}
+   fields = {"crop_hash": hash_crop_pixels(image, box)}
+   if image_ref:
+       fields["image_ref"] = image_ref
+   return fields
+
+def build_section(container: dict, image: Image.Image, id_generator: IDGenerator,
+                  images: str = "inline", image_ref: str = None) -> dict:
+   with span("build_section"):
+       return _build_section(container, image, id_generator, images, image_ref)
+
+def _build_section(container: dict, image: Image.Image, id_generator: IDGenerator,
+                   images: str, image_ref: str) -> dict:
+   section_id = id_generator.generate_id()
+   section_box = [int(x) for x in container['box']]
+   section_elements = []
+   
+   for element in container['elements']:
+       element_box = [int(x) for x in element['box']]
+       element_id = id_generator.generate_id()
+       
+       element_data = {
+           "id": element_id,
+           "score": element['score'],
+           "label": element['label'],
+           "box": element_box,
+           "position": get_position(element_box),
+           **crop_fields(image, element_box, images, image_ref),
+           "section_id": section_id,
+           "has_children": False,
+           "children_count": 0
+       }
+       
+       section_elements.append(element_data)
+
+   process_hierarchy(section_elements)
+   
+   return {
+       "id": section_id,
+       "box": section_box,
+       **crop_fields(image, section_box, images, image_ref),
+       "position_metadata": get_section_metadata(section_box, image.size[1]),
+       "has_children": bool(section_elements),
+       "children_count": len(section_elements),
+       "children": section_elements
+   }
+
+def check_images_mode(images: str):
+   if images not in IMAGE_MODES:
+       raise HTTPException(400, "images must be one of: " + ", ".join(IMAGE_MODES))
+
+def store_image(image_data: bytes, images: str) -> str:
+   return blob_store.put(image_data) if images == "ref" else None
+
 @router.post("/api/artifacts")
-async def extract_artifacts(file: UploadFile = File(...)):
+async def extract_artifacts(file: UploadFile = File(...), images: str = Query("inline")):
    if not file.content_type.startswith('image/'):
        raise HTTPException(400, "File must be an image")
-
-   id_generator.reset()
+   check_images_mode(images)
    
    image_data = await file.read()
    image = Image.open(io.BytesIO(image_data))
+   detection = await schedule_detection(detector.detect, image)
+   image_ref = await run_in_threadpool(store_image, image_data, images)
    
-   ui_detections, text_detections, layout_containers, _ = detector.detect(image)
-   
+   ui_detections, text_detections, layout_containers, image = await detection
+   result = await run_in_threadpool(build_artifacts, layout_containers, image, images, image_ref)
+   return JSONResponse(content=result)
+
+def build_artifacts(layout_containers: list, image: Image.Image, images: str, image_ref: str = None) -> dict:
+   id_generator = IDGenerator()
    all_elements = []
    sections = []
    
    for container in layout_containers:
-       section_id = id_generator.generate_id()
-       section_box = [int(x) for x in container['box']]
-       section_elements = []
-       
-       for element in container['elements']:
-           element_box = [int(x) for x in element['box']]
-           element_id = id_generator.generate_id()
-           
-           element_data = {
-               "id": element_id,
-               "score": element['score'],
-               "label": element['label'],
-               "box": element_box,
-               "position": get_position(element_box),
-               "image": get_cropped_image_base64(image, element_box),
-               "section_id": section_id,
-               "has_children": False,
-               "children_count": 0
-           }
-           
-           all_elements.append(element_data)
-           section_elements.append(element_data)
-
-       process_hierarchy(section_elements)
-       
-       section_data = {
-           "id": section_id,
-           "box": section_box,
-           "image": get_cropped_image_base64(image, section_box),
-           "position_metadata": get_section_metadata(section_box, image.size[1]),
-           "has_children": bool(section_elements),
-           "children_count": len(section_elements),
-           "children": section_elements
-       }
+       section_data = build_section(container, image, id_generator, images, image_ref)
+       all_elements.extend(section_data['children'])
        sections.append(section_data)
    
-   neighbors = calculate_neighbors(all_elements)
+   with span("neighbors"):
+       neighbors = calculate_neighbors(all_elements)
    
    for section in sections:
        for element in section['children']:
            element["neighbors"] = neighbors[element["id"]]
    
-   return JSONResponse(content={"sections": sections})
\ No newline at end of file
+   result = {"sections": sections}
+   if image_ref:
+       result["image_ref"] = image_ref
+   return result
+
+async def stream_artifacts(detection, images: str = "inline", image_ref: str = None):
+   """Yield NDJSON events: one `section` per layout container as soon as it is
+   final, then `neighbors` once all elements are known."""
+   try:
+       id_generator = IDGenerator()
+       ui_detections, text_detections, image = await detection
+       all_elements = []
+       
+       for container in detector.layout_analyzer.iter_sections(ui_detections + text_detections, image.size):
+           section_data = await run_in_threadpool(build_section, container, image, id_generator, images, image_ref)
+           all_elements.extend(section_data['children'])
+           yield json.dumps({"event": "section", "section": section_data}) + "\n"
+       
+       with span("neighbors"):
+           neighbors = await run_in_threadpool(calculate_neighbors, all_elements)
+       yield json.dumps({"event": "neighbors", "neighbors": neighbors}) + "\n"
+   except Exception as e:
+       yield json.dumps({"event": "error", "error": str(e), "type": type(e).__name__}) + "\n"
+
+@router.post("/api/artifacts/stream")
+async def extract_artifacts_stream(file: UploadFile = File(...), images: str = Query("inline")):
+   if not file.content_type.startswith('image/'):
+       raise HTTPException(400, "File must be an image")
+   check_images_mode(images)
+   
+   image_data = await file.read()
+   image = Image.open(io.BytesIO(image_data))
+   # Admission is decided before the response starts, so a saturated scheduler still gets a 429/503.
+   detection = await schedule_detection(detector.detect_elements, image)
+   image_ref = await run_in_threadpool(store_image, image_data, images)
+   
+   return StreamingResponse(stream_artifacts(detection, images, image_ref), media_type="application/x-ndjson")
+
+@router.get("/metrics")
+async def metrics():
+   return metrics_response()
+
+@router.get("/api/health")
+async def health():
+   return {"status": "ok", "scheduler": scheduler.stats()}
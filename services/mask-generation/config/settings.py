@@ -1,5 +1,33 @@
+import os
+
 MODEL_CONFIG = {
     'model_id': "IDEA-Research/grounding-dino-base",
+    'batched_prompts': True,     # Alle PROMPTS als eine Query in einem Forward-Pass (Backbone läuft einmal) statt einem Pass pro Prompt
+}
+
+BLOB_STORE = {
+    'backend': os.getenv('BLOB_STORE', 'redis'),             # "redis" oder "file" (gemeinsames Verzeichnis)
+    'redis_url': os.getenv('REDIS_URL', 'redis://redis:6379'),
+    'directory': os.getenv('BLOB_STORE_DIR', '/tmp/blobs'),
+    'ttl': int(os.getenv('BLOB_TTL', '3600'))                # Lebensdauer der Screenshots im Store (Sekunden)
+}
+
+SCHEDULER_CONFIG = {
+    'max_concurrent': int(os.getenv('MAX_CONCURRENT_TASKS', '2')),       # Gleichzeitig laufende Detection-Jobs
+    'max_queued': int(os.getenv('MAX_QUEUED_TASKS', '8')),               # Wartende Jobs, darüber 429
+    'job_memory_mb': int(os.getenv('GPU_JOB_MEMORY_MB', '2048')),       # GPU-Speicher pro Detection-Job; fehlt der frei, 503 (0 = aus)
+    'retry_after': int(os.getenv('RETRY_AFTER', '5')),                   # Retry-After-Header in Sekunden
+    # Mit SCHEDULER_REDIS=true gilt das Job-Limit über alle Replikas (Redis unter REDIS_URL)
+    'redis_url': os.getenv('REDIS_URL', 'redis://redis:6379') if os.getenv('SCHEDULER_REDIS', 'false').lower() == 'true' else None,
+}
+
+OCR_CONFIG = {
+    'languages': ['en', 'de'],
+    'gpu': os.getenv('OCR_GPU', 'true').lower() == 'true',
+    'workers': int(os.getenv('OCR_WORKERS', '2')),   # Prozesse mit eigenem easyocr-Reader, 0 = im Hauptprozess
+    'region_restricted': os.getenv('OCR_REGION_RESTRICTED', 'false').lower() == 'true',  # Nur in erkannten UI-Boxen lesen
+    'region_padding': 8,         # Rand um jede UI-Box in Pixeln
+    'region_merge_gap': 16       # Regionen mit kleinerem Abstand werden zusammengelegt
 }
 
 TEXT_DETECTION_PARAMS = {
@@ -13,6 +41,13 @@ TEXT_DETECTION_PARAMS = {
     'heading_min_height': 20     # Reduziert von 25 auf 20 für kleinere Überschriften
 }
 
+LAYOUT_ANALYSIS_PARAMS = {
+    'min_gap_size': 20,          # Minimaler vertikaler Abstand zwischen zwei Sections
+    'split_columns': False,      # Hohe Sections zusätzlich in Spalten (und Zeilen) aufteilen (XY-Cut)
+    'split_min_height': 1200,    # Ab dieser Section-Höhe wird weiter aufgeteilt
+    'max_split_depth': 2         # Maximale Rekursionstiefe der Aufteilung
+}
+
 LAYOUT_PATTERNS = {
     'menu_bar': {
         'height_range': (20, 40),
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from api.router import router
+from src.telemetry import TraceMiddleware
 
 app = FastAPI()
+app.add_middleware(TraceMiddleware)
 app.include_router(router)
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import hashlib
+import os
+from typing import Optional
+
+import redis
+
+class RedisBlobStore:
+    """Content-addressed blobs in Redis, keyed by the sha256 of their bytes."""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "blob:"):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        # NX keeps an existing copy; the expiry is refreshed either way.
+        if not self.client.set(self.prefix + key, data, nx=True, ex=self.ttl):
+            self.client.expire(self.prefix + key, self.ttl)
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+class FileBlobStore:
+    """Content-addressed blobs in a directory shared between the services.
+
+    Files are not expired here; cleanup is left to whoever owns the volume.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, key)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.directory, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+def create_blob_store(config: dict):
+    if config['backend'] == 'file':
+        return FileBlobStore(config['directory'])
+    return RedisBlobStore(config['redis_url'], config['ttl'])
+
+def hash_crop_pixels(image, box: list) -> str:
+    """Content hash of a crop's decoded pixels, so identical crops share one key without PNG encoding."""
+    cropped = image.crop(box)
+    digest = hashlib.sha256(f"{cropped.mode}:{cropped.size}".encode())
+    digest.update(cropped.tobytes())
+    return digest.hexdigest()
@@ -1,11 +1,14 @@
+import re
+import time
 import torch
 from PIL import Image
 from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
-from config.settings import MODEL_CONFIG, PROMPTS
+from config.settings import MODEL_CONFIG, PROMPTS, LAYOUT_ANALYSIS_PARAMS, OCR_CONFIG
 from .processors import LayoutProcessor
 from .visualizer import UIVisualizer
 from .text import TextDetector
 from .layout import LayoutAnalyzer
+from .telemetry import PROMPT_SECONDS, observe_stage, span
 
 class RefinedUIDetector:
     def __init__(self):
@@ -16,51 +19,45 @@ class RefinedUIDetector:
         self.layout_processor = LayoutProcessor()
         self.visualizer = UIVisualizer()
         self.text_detector = TextDetector()
-        self.layout_analyzer = LayoutAnalyzer()
+        self.layout_analyzer = LayoutAnalyzer(**LAYOUT_ANALYSIS_PARAMS)
 
     def detect(self, image: Image.Image, confidence_threshold: float = 0.15):
+        processed_ui, text_detections, image = self.detect_elements(image, confidence_threshold)
+        with span("layout"):
+            layout_containers = self.layout_analyzer.analyze(processed_ui + text_detections, image.size)
+        return processed_ui, text_detections, layout_containers, image
+
+    def detect_elements(self, image: Image.Image, confidence_threshold: float = 0.15):
         try:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
-                
-            ui_detections = []
-            for prompt in PROMPTS:
-                inputs = self.processor(images=image, text=prompt, return_tensors="pt").to(self.device)
-                
-                try:
-                    with torch.no_grad():
-                        outputs = self.model(**inputs)
-                    
-                    results = self.processor.post_process_grounded_object_detection(
-                        outputs,
-                        inputs.input_ids,
-                        box_threshold=confidence_threshold,
-                        text_threshold=confidence_threshold,
-                        target_sizes=[image.size[::-1]]
-                    )[0]
-                    
-                    for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-                        if score >= confidence_threshold:
-                            ui_detections.append({
-                                'box': box.tolist(),
-                                'score': score.item(),
-                                'label': label
-                            })
-                            
-                finally:
-                    del inputs
-                    if torch.cuda.is_initialized():
-                        try:
-                            torch.cuda.empty_cache()
-                        except RuntimeError:
-                            pass
-
-            text_detections = self.text_detector.detect(image)
-            processed_ui = self.layout_processor.process_layout(ui_detections)
-            all_detections = processed_ui + text_detections
-            layout_containers = self.layout_analyzer.analyze(all_detections, image.size)
+
+            # Full-image OCR runs in the worker processes while GroundingDINO runs here.
+            # Region-restricted OCR needs the UI boxes first, so it starts afterwards.
+            text_future = None
+            if not OCR_CONFIG['region_restricted']:
+                ocr_start = time.perf_counter()
+                text_future = self.text_detector.submit(image)
+                text_future.add_done_callback(
+                    lambda future: observe_stage("ocr", time.perf_counter() - ocr_start,
+                                                 future.cancelled() or future.exception() is not None))
+
+            with span("grounding_dino"):
+                if MODEL_CONFIG['batched_prompts']:
+                    ui_detections = self._detect_ui_batched(image, confidence_threshold)
+                else:
+                    ui_detections = self._detect_ui_per_prompt(image, confidence_threshold)
+
+            with span("layout_processing"):
+                processed_ui = self.layout_processor.process_layout(ui_detections)
+            if text_future is None:
+                with span("ocr"):
+                    text_detections = self.text_detector.detect_in_regions(image, [det['box'] for det in processed_ui])
+            else:
+                with span("ocr_wait"):
+                    text_detections = text_future.result()
             
-            return processed_ui, text_detections, layout_containers, image
+            return processed_ui, text_detections, image
 
         finally:
             if torch.cuda.is_initialized():
@@ -69,6 +66,100 @@ class RefinedUIDetector:
                 except RuntimeError:
                     pass
 
+    def _collect_detections(self, results, confidence_threshold: float) -> list:
+        detections = []
+        for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
+            if score >= confidence_threshold:
+                detections.append({
+                    'box': box.tolist(),
+                    'score': score.item(),
+                    'label': label
+                })
+        return detections
+
+    def _detect_ui_batched(self, image: Image.Image, confidence_threshold: float) -> list:
+        """Run all PROMPTS as one "."-separated query in a single forward pass.
+
+        The image backbone and encoder run once instead of once per prompt.
+        Every box is labelled with the phrase whose tokens score highest, so
+        labels name single prompt phrases as in the per-prompt path. Falls back
+        to one pass per prompt when the query exceeds the model's text length.
+        """
+        query = " ".join(prompt.strip() for prompt in PROMPTS)
+        inputs = self.processor(images=image, text=query, return_tensors="pt").to(self.device)
+        if inputs.input_ids.shape[1] > self.model.config.max_text_len:
+            return self._detect_ui_per_prompt(image, confidence_threshold)
+
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+
+        phrases = self._query_phrases(inputs.input_ids[0].tolist())
+        token_scores = outputs.logits[0].sigmoid()
+        phrase_scores = torch.stack([token_scores[:, positions].max(dim=-1).values for positions, _ in phrases], dim=-1)
+        scores, best_phrases = phrase_scores.max(dim=-1)
+        keep = scores >= confidence_threshold
+
+        width, height = image.size
+        center_x, center_y, box_width, box_height = outputs.pred_boxes[0][keep].unbind(-1)
+        boxes = torch.stack([
+            (center_x - box_width / 2) * width, (center_y - box_height / 2) * height,
+            (center_x + box_width / 2) * width, (center_y + box_height / 2) * height
+        ], dim=-1)
+
+        return [
+            {'box': box.tolist(), 'score': score.item(), 'label': phrases[phrase][1]}
+            for box, score, phrase in zip(boxes, scores[keep], best_phrases[keep].tolist())
+        ]
+
+    def _query_phrases(self, input_ids: list) -> list:
+        """Token positions and text of every "."-separated phrase of a tokenized query.
+
+        Leading articles are dropped from the text ("a home icon" -> "home icon").
+        """
+        tokenizer = self.processor.tokenizer
+        separators = {tokenizer.cls_token_id, tokenizer.sep_token_id, tokenizer.convert_tokens_to_ids(".")}
+        phrases, positions = [], []
+        for position, token_id in enumerate(input_ids + [tokenizer.sep_token_id]):
+            if token_id not in separators:
+                positions.append(position)
+            elif positions:
+                text = tokenizer.decode([input_ids[p] for p in positions])
+                phrases.append((positions, re.sub(r"^(a|an) ", "", text)))
+                positions = []
+        return phrases
+
+    def _detect_ui_per_prompt(self, image: Image.Image, confidence_threshold: float) -> list:
+        """Reference path: one full forward pass per prompt."""
+        ui_detections = []
+        for prompt in PROMPTS:
+            prompt_start = time.perf_counter()
+            inputs = self.processor(images=image, text=prompt, return_tensors="pt").to(self.device)
+            
+            try:
+                with torch.no_grad():
+                    outputs = self.model(**inputs)
+                
+                results = self.processor.post_process_grounded_object_detection(
+                    outputs,
+                    inputs.input_ids,
+                    box_threshold=confidence_threshold,
+                    text_threshold=confidence_threshold,
+                    target_sizes=[image.size[::-1]]
+                )[0]
+                
+                ui_detections.extend(self._collect_detections(results, confidence_threshold))
+                PROMPT_SECONDS.labels(prompt).observe(time.perf_counter() - prompt_start)
+                        
+            finally:
+                del inputs
+                if torch.cuda.is_initialized():
+                    try:
+                        torch.cuda.empty_cache()
+                    except RuntimeError:
+                        pass
+
+        return ui_detections
+
     def __del__(self):
         if hasattr(self, 'model'):
             try:
@@ -0,0 +1,52 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List
+
+import numpy as np
+
+def is_contained_within(box1, box2):
+    return (box1[0] >= box2[0] and box1[1] >= box2[1] and
+            box1[2] <= box2[2] and box1[3] <= box2[3])
+
+def find_contained_reference(elements: list) -> Dict[str, List[str]]:
+    """Original all-pairs containment check, kept as the reference for benchmarks."""
+    contained = {}
+    for element in elements:
+        contained[element['id']] = [
+            other['id'] for other in elements
+            if other['id'] != element['id'] and is_contained_within(other['box'], element['box'])
+        ]
+    return contained
+
+def _supports_index(elements: list) -> bool:
+    ids = [element['id'] for element in elements]
+    if len(set(ids)) != len(ids):
+        return False
+    return all(element['box'][0] <= element['box'][2] for element in elements)
+
+def find_contained(elements: list) -> Dict[str, List[str]]:
+    """Ids of every other element whose box lies inside each element's box.
+
+    Elements are indexed by x1, so a parent only checks the elements whose x1
+    falls inside its own x-range; the remaining edges are compared with NumPy.
+    Returns the same map as find_contained_reference, children in input order.
+    Duplicate ids or boxes with x1 > x2 fall back to the reference.
+    """
+    if not _supports_index(elements):
+        return find_contained_reference(elements)
+
+    boxes = np.asarray([element['box'] for element in elements], dtype=np.float64).reshape(-1, 4)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    sorted_boxes = boxes[order]
+    sorted_x1 = sorted_boxes[:, 0].tolist()
+
+    contained = {}
+    for index, element in enumerate(elements):
+        x1, y1, x2, y2 = boxes[index]
+        # A child with x1 >= parent x1 and x2 <= parent x2 must start within [x1, x2].
+        lo = bisect_left(sorted_x1, x1)
+        hi = bisect_right(sorted_x1, x2)
+        window = sorted_boxes[lo:hi]
+        inside = (window[:, 2] <= x2) & (window[:, 1] >= y1) & (window[:, 3] <= y2)
+        members = np.sort(order[lo:hi][inside])
+        contained[element['id']] = [elements[j]['id'] for j in members.tolist() if j != index]
+    return contained
@@ -1,72 +1,139 @@
-from typing import List, Dict, Tuple
+from typing import Dict, Iterator, List, Tuple
 import numpy as np
 
+MEMBERSHIP_OVERLAP = 0.4
+
 class LayoutAnalyzer:
-    def __init__(self, min_gap_size: int = 20):
+    def __init__(self, min_gap_size: int = 20, split_columns: bool = False,
+                 split_min_height: int = 1200, max_split_depth: int = 2):
         self.min_gap_size = min_gap_size
+        self.split_columns = split_columns
+        self.split_min_height = split_min_height
+        self.max_split_depth = max_split_depth
 
     def analyze(self, detections: List[Dict], image_size: Tuple[int, int]) -> List[Dict]:
-        y_coords = []
+        return list(self.iter_sections(detections, image_size))
+
+    def iter_sections(self, detections: List[Dict], image_size: Tuple[int, int]) -> Iterator[Dict]:
+        """Yield each section container as soon as its range is final.
+
+        Sections are the bands between vertical gaps. With `split_columns`, bands
+        at least `split_min_height` tall are cut again along x (and the columns
+        along y, alternating) up to `max_split_depth` levels, XY-cut style.
+        """
+        bounds = [0, 0, image_size[0], image_size[1]]
+        section_count = 0
+        for box, elements in self._cut(detections, bounds, axis=1, depth=0):
+            yield {
+                'id': f'section_{section_count}',
+                'box': box,
+                'elements': elements,
+                'type': 'section',
+                'confidence': 1.0,
+                'label': 'section'
+            }
+            section_count += 1
+
+    def _find_gaps(self, detections: List[Dict], axis: int, origin) -> List[Tuple]:
+        coords = []
         for det in detections:
-            y1, y2 = det['box'][1], det['box'][3]
-            y_coords.extend([(y1, 'start'), (y2, 'end')])
+            start, end = det['box'][axis], det['box'][axis + 2]
+            coords.extend([(start, 'start'), (end, 'end')])
+
+        coords.sort(key=lambda x: x[0])
 
-        y_coords.sort(key=lambda x: x[0])
-        
         current_open = 0
         gaps = []
-        last_y = 0
+        last = origin
 
-        for y, coord_type in y_coords:
-            if current_open == 0 and last_y > 0:
-                gap_size = y - last_y
+        for value, coord_type in coords:
+            if current_open == 0 and last > origin:
+                gap_size = value - last
                 if gap_size >= self.min_gap_size:
-                    gaps.append((last_y, y))
+                    gaps.append((last, value))
 
             if coord_type == 'start':
                 current_open += 1
             else:
                 current_open -= 1
-            last_y = y
+            last = value
+
+        return gaps
 
-        containers = []
-        current_y = 0
-        image_height = image_size[1]
+    def _cut(self, detections: List[Dict], bounds: list, axis: int, depth: int) -> Iterator[Tuple[list, List[Dict]]]:
+        """Split `bounds` at the gaps along `axis`, yielding (box, elements) per non-empty range."""
+        origin, limit = bounds[axis], bounds[axis + 2]
+        gaps = self._find_gaps(detections, axis, origin)
 
+        ranges = []
+        current = origin
         for gap_start, gap_end in gaps:
-            if current_y < gap_start:
-                elements = self._get_elements_in_section(detections, current_y, gap_start)
-                if elements:
-                    containers.append({
-                        'id': f'section_{len(containers)}',
-                        'box': [0, current_y, image_size[0], gap_start],
-                        'elements': elements,
-                        'type': 'section',
-                        'confidence': 1.0,
-                        'label': 'section'
-                    })
-            current_y = gap_end
-
-        if current_y < image_height:
-            elements = self._get_elements_in_section(detections, current_y, image_height)
-            if elements:
-                containers.append({
-                    'id': f'section_{len(containers)}',
-                    'box': [0, current_y, image_size[0], image_height],
-                    'elements': elements,
-                    'type': 'section',
-                    'confidence': 1.0,
-                    'label': 'section'
-                })
-
-        return containers
-
-    def _get_elements_in_section(self, detections: List[Dict], y1: int, y2: int) -> List[Dict]:
+            if current < gap_start:
+                ranges.append((current, gap_start))
+            current = gap_end
+        if current < limit:
+            ranges.append((current, limit))
+
+        members = self._assign(detections, ranges, axis)
+        for (start, end), elements in zip(ranges, members):
+            if not elements:
+                continue
+            box = list(bounds)
+            box[axis], box[axis + 2] = start, end
+            if self._should_split(box, depth):
+                yield from self._split(elements, box, 1 - axis, depth + 1)
+            else:
+                yield box, elements
+
+    def _should_split(self, box: list, depth: int) -> bool:
+        return (self.split_columns and depth < self.max_split_depth
+                and box[3] - box[1] >= self.split_min_height)
+
+    def _split(self, elements: List[Dict], box: list, axis: int, depth: int) -> Iterator[Tuple[list, List[Dict]]]:
+        parts = list(self._cut(elements, box, axis, depth))
+        # No gap along this axis: keep the range whole rather than re-deriving it.
+        if len(parts) <= 1:
+            yield box, elements
+        else:
+            yield from parts
+
+    def _assign(self, detections: List[Dict], ranges: List[Tuple], axis: int = 1) -> List[List[Dict]]:
+        """Members of each range under the 0.4-overlap rule, in detection order.
+
+        Detections are sorted by their start coordinate once. A detection can only
+        overlap a range if it starts before the range ends and no earlier than
+        range start minus the tallest detection, so each range compares just that
+        window with NumPy. Inverted boxes fall back to _get_elements_in_section.
+        """
+        if not detections or not ranges:
+            return [[] for _ in ranges]
+
+        coords = np.asarray([[det['box'][axis], det['box'][axis + 2]] for det in detections], dtype=np.float64)
+        extents = coords[:, 1] - coords[:, 0]
+        if (extents < 0).any():
+            return [self._get_elements_in_section(detections, start, end, axis) for start, end in ranges]
+
+        order = np.argsort(coords[:, 0], kind="stable")
+        starts = coords[order, 0]
+        ends = coords[order, 1]
+        sorted_extents = extents[order]
+        max_extent = sorted_extents.max()
+
+        members = []
+        for start, end in ranges:
+            lo = np.searchsorted(starts, start - max_extent, side="left")
+            hi = np.searchsorted(starts, end, side="left")
+            overlap = np.minimum(ends[lo:hi], end) - np.maximum(starts[lo:hi], start)
+            inside = overlap > sorted_extents[lo:hi] * MEMBERSHIP_OVERLAP
+            members.append([detections[i] for i in np.sort(order[lo:hi][inside]).tolist()])
+        return members
+
+    def _get_elements_in_section(self, detections: List[Dict], y1: int, y2: int, axis: int = 1) -> List[Dict]:
         section_elements = []
         for det in detections:
-            det_y1, det_y2 = det['box'][1], det['box'][3]
+            det_y1, det_y2 = det['box'][axis], det['box'][axis + 2]
             element_height = det_y2 - det_y1
             overlap = min(det_y2, y2) - max(det_y1, y1)
-            if overlap > element_height * 0.4:
+            if overlap > element_height * MEMBERSHIP_OVERLAP:
                 section_elements.append(det)
-        return section_elements
\ No newline at end of file
+        return section_elements
@@ -0,0 +1,173 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from .telemetry import observe_stage, span
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+MB = 1024 ** 2
+
+def to_mb(value: Optional[int]) -> Optional[int]:
+    return None if value is None else round(value / MB)
+
+class SchedulerBusy(Exception):
+    """Raised instead of queueing a job the service cannot take right now."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class GPUMemoryMonitor:
+    """GPU memory of the device this process runs on, in bytes. Reports None without CUDA.
+
+    Headroom is what a new job can still allocate: memory free on the device
+    plus what torch's caching allocator holds but has not handed out. Model
+    weights, finished jobs' cached blocks and other processes sharing the GPU
+    are thereby accounted for, instead of comparing device-wide usage.
+    """
+
+    def __init__(self):
+        self.device = torch.cuda.current_device() if torch is not None and torch.cuda.is_available() else None
+
+    def headroom(self) -> Optional[int]:
+        if self.device is None:
+            return None
+        free, _ = torch.cuda.mem_get_info(self.device)
+        cached = torch.cuda.memory_reserved(self.device) - torch.cuda.memory_allocated(self.device)
+        return free + cached
+
+    def allocated(self) -> Optional[int]:
+        return None if self.device is None else torch.cuda.memory_allocated(self.device)
+
+    def peak_allocated(self) -> Optional[int]:
+        return None if self.device is None else torch.cuda.max_memory_allocated(self.device)
+
+class RedisSlots:
+    """Cluster-wide job slots: a sorted set of job ids scored by start time.
+
+    Slots of replicas that died mid-job are reclaimed after `lease_ttl` seconds.
+    """
+
+    def __init__(self, url: str, limit: int, lease_ttl: int, key: str = "mask-generation:jobs"):
+        import redis.asyncio as redis
+        self.client = redis.Redis.from_url(url)
+        self.limit = limit
+        self.lease_ttl = lease_ttl
+        self.key = key
+
+    async def acquire(self, job_id: str) -> bool:
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(self.key, "-inf", now - self.lease_ttl)
+            pipe.zadd(self.key, {job_id: now})
+            pipe.zcard(self.key)
+            _, _, count = await pipe.execute()
+        if count > self.limit:
+            await self.client.zrem(self.key, job_id)
+            return False
+        return True
+
+    async def release(self, job_id: str):
+        await self.client.zrem(self.key, job_id)
+
+class GPUJobScheduler:
+    """Bounded executor for GPU work with admission control.
+
+    At most `max_concurrent` jobs run at once and at most `max_queued` wait
+    behind them; anything beyond that is rejected with 429. New jobs are also
+    rejected with 503 while the GPU lacks `job_memory_mb` of headroom for each
+    job that is admitted but has not started yet, up to `max_concurrent` jobs.
+    With `redis_url` the running-plus-queued limit is enforced across replicas.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, job_memory_mb: int,
+                 retry_after: int = 5, redis_url: Optional[str] = None, lease_ttl: int = 600):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.job_memory_mb = job_memory_mb
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="gpu-job")
+        self.memory = GPUMemoryMonitor()
+        self.slots = RedisSlots(redis_url, max_concurrent + max_queued, lease_ttl) if redis_url else None
+        self.in_flight = 0
+        self.running = 0
+        self.rejected = 0
+
+    async def submit(self, fn, *args) -> asyncio.Future:
+        """Admit a job and start it in the executor; returns a future of its result.
+
+        Admission happens before anything is queued, so callers can still answer
+        with an error status when the scheduler is saturated.
+        """
+        if self.in_flight >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            raise SchedulerBusy("Too many detection jobs in progress", 429, self.retry_after)
+        if not self._has_headroom():
+            self.rejected += 1
+            raise SchedulerBusy("Not enough free GPU memory for another detection job", 503, self.retry_after)
+
+        job_id = uuid.uuid4().hex
+        self.in_flight += 1
+        try:
+            if self.slots and not await self.slots.acquire(job_id):
+                self.rejected += 1
+                raise SchedulerBusy("Too many detection jobs in progress across replicas", 429, self.retry_after)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+
+        submitted_at = time.perf_counter()
+
+        def run_job():
+            observe_stage("queue_wait", time.perf_counter() - submitted_at)
+            self.running += 1
+            try:
+                with span("detection_job"):
+                    return fn(*args)
+            finally:
+                self.running -= 1
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run_job)
+        future.add_done_callback(lambda _: self._release(job_id))
+        return future
+
+    def _has_headroom(self) -> bool:
+        """Whether the GPU can hold the new job next to the admitted jobs that have not allocated yet.
+
+        Running jobs already hold their memory. Jobs beyond the free executor
+        workers only start once a running job has returned its memory to the
+        cache, so at least one job's worth is required, at most one per free
+        worker.
+        """
+        headroom = self.memory.headroom()
+        if not self.job_memory_mb or headroom is None:
+            return True
+        starting = max(1, min(self.in_flight - self.running + 1, self.max_concurrent - self.running))
+        return headroom >= starting * self.job_memory_mb * MB
+
+    async def run(self, fn, *args):
+        return await (await self.submit(fn, *args))
+
+    def _release(self, job_id: str):
+        self.in_flight -= 1
+        if self.slots:
+            asyncio.ensure_future(self.slots.release(job_id))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.in_flight - self.running,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "rejected": self.rejected,
+            "job_memory_mb": self.job_memory_mb,
+            "gpu_headroom_mb": to_mb(self.memory.headroom()),
+            "gpu_allocated_mb": to_mb(self.memory.allocated()),
+            "gpu_peak_allocated_mb": to_mb(self.memory.peak_allocated())
+        }
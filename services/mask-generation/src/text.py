@@ -1,30 +1,131 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Tuple
 import easyocr
 from PIL import Image
 import numpy as np
+from config.settings import OCR_CONFIG
+
+# Reader of the current OCR worker process, created once by _init_worker
+_worker_reader = None
+
+def _init_worker(languages: List[str], gpu: bool):
+    global _worker_reader
+    _worker_reader = easyocr.Reader(languages, gpu=gpu)
+
+def _warmup() -> bool:
+    return _worker_reader is not None
+
+def _to_detections(results, offset_x: int = 0, offset_y: int = 0) -> List[dict]:
+    detections = []
+    for box, text, conf in results:
+        # Convert box points to [x1,y1,x2,y2] format
+        x1, y1 = min(point[0] for point in box), min(point[1] for point in box)
+        x2, y2 = max(point[0] for point in box), max(point[1] for point in box)
+
+        detections.append({
+            'box': [x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y],
+            'score': conf,
+            'label': text
+        })
+    return detections
+
+def _read_tiles(tiles: List[Tuple[np.ndarray, int, int]], reader=None) -> List[dict]:
+    """OCR each (pixels, x offset, y offset) tile, returning boxes in image coordinates."""
+    reader = reader or _worker_reader
+    detections = []
+    for tile, offset_x, offset_y in tiles:
+        detections.extend(_to_detections(reader.readtext(tile), offset_x, offset_y))
+    return detections
+
+def merge_regions(boxes: List[list], image_size: tuple, padding: int, merge_gap: int) -> List[List[int]]:
+    """Pad boxes, clip them to the image and merge those closer than `merge_gap`.
+
+    The result never overlaps, so text is read at most once.
+    """
+    width, height = image_size
+    regions = []
+    for box in boxes:
+        x1, y1 = max(0, int(box[0]) - padding), max(0, int(box[1]) - padding)
+        x2, y2 = min(width, int(box[2]) + padding), min(height, int(box[3]) + padding)
+        if x2 > x1 and y2 > y1:
+            regions.append([x1, y1, x2, y2])
+
+    merged = True
+    while merged:
+        merged = False
+        regions.sort()
+        result = []
+        for region in regions:
+            for other in result:
+                if (region[0] <= other[2] + merge_gap and other[0] <= region[2] + merge_gap and
+                        region[1] <= other[3] + merge_gap and other[1] <= region[3] + merge_gap):
+                    other[0], other[1] = min(other[0], region[0]), min(other[1], region[1])
+                    other[2], other[3] = max(other[2], region[2]), max(other[3], region[3])
+                    merged = True
+                    break
+            else:
+                result.append(region)
+        regions = result
+    return regions
 
 class TextDetector:
-    def __init__(self):
-        self.reader = easyocr.Reader(['en', 'de'])
-    
-    def detect(self, image_path):
+    """easyocr text detection, run in a pool of worker processes.
+
+    Each worker loads its own reader once, so OCR neither blocks the caller's
+    thread nor competes with GroundingDINO for the GIL. With `workers` set to 0
+    OCR runs in-process, as before.
+    """
+
+    def __init__(self, config: dict = OCR_CONFIG):
+        self.config = config
+        self.reader = None
+        self.pool = None
+        if config['workers'] > 0:
+            # CUDA cannot be re-initialized in a forked child, so workers are spawned.
+            self.pool = ProcessPoolExecutor(
+                max_workers=config['workers'],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config['languages'], config['gpu'])
+            )
+            for _ in range(config['workers']):
+                self.pool.submit(_warmup)
+        else:
+            self.reader = easyocr.Reader(config['languages'], gpu=config['gpu'])
+
+    def _submit_tiles(self, tiles: List[Tuple[np.ndarray, int, int]]) -> Future:
+        if self.pool is not None:
+            return self.pool.submit(_read_tiles, tiles)
+        future = Future()
+        try:
+            future.set_result(_read_tiles(tiles, self.reader))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, image_path) -> Future:
+        """Start OCR of the whole image and return a future of the detections."""
         if isinstance(image_path, str):
             image = Image.open(image_path)
         else:
             image = image_path
-            
-        image_np = np.array(image)
-        results = self.reader.readtext(image_np)
-        
-        detections = []
-        for box, text, conf in results:
-            # Convert box points to [x1,y1,x2,y2] format
-            x1, y1 = min(point[0] for point in box), min(point[1] for point in box)
-            x2, y2 = max(point[0] for point in box), max(point[1] for point in box)
-            
-            detections.append({
-                'box': [x1, y1, x2, y2],
-                'score': conf,
-                'label': text
-            })
-            
-        return detections
\ No newline at end of file
+        return self._submit_tiles([(np.array(image), 0, 0)])
+
+    def detect(self, image_path):
+        return self.submit(image_path).result()
+
+    def detect_in_regions(self, image: Image.Image, boxes: List[list]) -> List[dict]:
+        """OCR only around candidate boxes.
+
+        Only the merged region crops are sent to the workers, split into one
+        contiguous chunk per worker so results keep region order.
+        """
+        regions = merge_regions(boxes, image.size, self.config['region_padding'], self.config['region_merge_gap'])
+        if not regions:
+            return []
+        image_np = np.asarray(image)
+        tiles = [(np.ascontiguousarray(image_np[y1:y2, x1:x2]), x1, y1) for x1, y1, x2, y2 in regions]
+        chunk_size = -(-len(tiles) // max(1, self.config['workers']))
+        futures = [self._submit_tiles(tiles[i:i + chunk_size]) for i in range(0, len(tiles), chunk_size)]
+        return [detection for future in futures for detection in future.result()]
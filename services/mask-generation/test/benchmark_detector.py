@@ -0,0 +1,111 @@
+"""Benchmark GroundingDINO prompt batching: _detect_ui_per_prompt against _detect_ui_batched.
+
+The per-prompt path runs the model once per entry of PROMPTS; the batched path
+joins them into one query and runs it once. Boxes of both paths are compared
+by IoU, since one query and separate queries do not score boxes identically.
+Runs on CPU unless --device is given.
+
+--random-weights times the grounding-dino-base architecture with random
+weights and a tokenizer built from the PROMPTS vocabulary, for machines
+without access to the Hugging Face Hub. Timings are representative, boxes
+are not, so they are not compared.
+
+Usage (from services/mask-generation):
+    python test/benchmark_detector.py [--screenshot test/screenshots/home.png] [--repeat 3] [--random-weights]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from PIL import Image
+from transformers import (AutoModelForZeroShotObjectDetection, AutoProcessor, BertTokenizer, GroundingDinoConfig,
+                          GroundingDinoForObjectDetection, GroundingDinoImageProcessor, GroundingDinoProcessor)
+
+from config.settings import MODEL_CONFIG, PROMPTS
+from src.detector import RefinedUIDetector
+
+SCREENSHOTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "screenshots")
+
+# Swin-B backbone of IDEA-Research/grounding-dino-base; everything else uses the config defaults
+BASE_BACKBONE = {
+    "model_type": "swin", "embed_dim": 128, "depths": [2, 2, 18, 2], "num_heads": [4, 8, 16, 32],
+    "window_size": 12, "image_size": 384, "out_features": ["stage2", "stage3", "stage4"]
+}
+
+def random_weights_model():
+    words = sorted(set(re.findall(r"[a-z]+", " ".join(PROMPTS).lower())))
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as vocab:
+        vocab.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "."] + words))
+    processor = GroundingDinoProcessor(GroundingDinoImageProcessor(), BertTokenizer(vocab.name))
+    return processor, GroundingDinoForObjectDetection(GroundingDinoConfig(backbone_config=BASE_BACKBONE))
+
+def load_detector(device: str, random_weights: bool) -> RefinedUIDetector:
+    """Detector with only the GroundingDINO parts; OCR and layout are not needed here."""
+    detector = RefinedUIDetector.__new__(RefinedUIDetector)
+    detector.device = device
+    if random_weights:
+        detector.processor, model = random_weights_model()
+    else:
+        detector.processor = AutoProcessor.from_pretrained(MODEL_CONFIG['model_id'])
+        model = AutoModelForZeroShotObjectDetection.from_pretrained(MODEL_CONFIG['model_id'])
+    detector.model = model.to(device).eval()
+    return detector
+
+def timed(fn, image: Image.Image, threshold: float, repeat: int):
+    """Detections of the last run and the best wall time over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detections = fn(image, threshold)
+        best = min(best, time.perf_counter() - start)
+    return detections, best
+
+def iou(a: list, b: list) -> float:
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def recall(reference: list, detections: list, threshold: float = 0.5) -> float:
+    """Share of reference boxes overlapped by a detection with IoU >= threshold."""
+    if not reference:
+        return 1.0
+    found = sum(any(iou(ref['box'], det['box']) >= threshold for det in detections) for ref in reference)
+    return found / len(reference)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screenshot", default=os.path.join(SCREENSHOTS, "home.png"))
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    image = Image.open(args.screenshot).convert("RGB")
+    detector = load_detector(args.device, args.random_weights)
+    query_tokens = len(detector.processor.tokenizer(" ".join(PROMPTS)).input_ids)
+    # Warm-up, so the first timed path does not pay for lazy initialization
+    detector._detect_ui_batched(image, args.threshold)
+
+    reference, reference_time = timed(detector._detect_ui_per_prompt, image, args.threshold, args.repeat)
+    batched, batched_time = timed(detector._detect_ui_batched, image, args.threshold, args.repeat)
+
+    print(f"{os.path.basename(args.screenshot)} {image.size[0]}x{image.size[1]}, {len(PROMPTS)} prompts "
+          f"({query_tokens} query tokens), device {args.device}, "
+          f"{'random' if args.random_weights else 'pretrained'} weights, best of {args.repeat}")
+    print(f"{'path':<12} {'time':>9} {'speedup':>9} {'boxes':>7}  recall@0.5")
+    print(f"{'per prompt':<12} {reference_time:>8.2f}s {'1.0x':>9} {len(reference):>7}  -")
+    agreement = "-" if args.random_weights else f"{recall(reference, batched):.0%}"
+    print(f"{'batched':<12} {batched_time:>8.2f}s {reference_time / batched_time:>8.1f}x {len(batched):>7}  {agreement}")
+
+if __name__ == "__main__":
+    main()
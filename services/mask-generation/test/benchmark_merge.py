@@ -0,0 +1,59 @@
+"""Benchmark LayoutProcessor.merge_overlapping_boxes against the pairwise reference.
+
+Usage (from services/mask-generation):
+    python test/benchmark_merge.py [--sizes 100 1000 10000] [--reference-limit 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.processors import LayoutProcessor
+
+LABELS = ["button", "icon", "input field", "text", "menu item", "checkbox"]
+
+def synthetic_detections(count: int, seed: int = 0) -> list:
+    """Raw multi-prompt detections: clusters of jittered duplicates plus degenerate boxes."""
+    rng = random.Random(seed)
+    width, height = 1920, max(1080, count * 2)
+    detections = []
+    while len(detections) < count:
+        x1, y1 = rng.uniform(0, width - 200), rng.uniform(0, height - 80)
+        w, h = rng.uniform(10, 200), rng.uniform(10, 80)
+        for _ in range(rng.randint(1, 6)):
+            jitter = [rng.uniform(-6, 6) for _ in range(4)]
+            box = [x1 + jitter[0], y1 + jitter[1], x1 + w + jitter[2], y1 + h + jitter[3]]
+            if rng.random() < 0.02:
+                box = [x1, y1, x1, y1]
+            detections.append({"box": box, "score": round(rng.uniform(0.15, 0.9), 2), "label": rng.choice(LABELS)})
+    return detections[:count]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--reference-limit", type=int, default=10000,
+                        help="skip the reference implementation above this many boxes")
+    args = parser.parse_args()
+
+    processor = LayoutProcessor()
+    print(f"{'boxes':>7} {'merged':>7} {'reference':>12} {'numpy':>10} {'speedup':>9}  identical")
+    for size in args.sizes:
+        detections = synthetic_detections(size, seed=size)
+        fast, fast_time = timed(processor.merge_overlapping_boxes, detections)
+        if size > args.reference_limit:
+            print(f"{size:>7} {len(fast):>7} {'skipped':>12} {fast_time:>9.3f}s {'-':>9}  -")
+            continue
+        reference, reference_time = timed(processor.merge_overlapping_boxes_reference, detections)
+        print(f"{size:>7} {len(fast):>7} {reference_time:>11.3f}s {fast_time:>9.3f}s "
+              f"{reference_time / fast_time:>8.1f}x  {fast == reference}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark calculate_neighbors against the all-pairs reference on synthetic layouts.
+
+Usage (from services/mask-generation):
+    python test/benchmark_neighbors.py [--sizes 100 500 1000 5000] [--reference-limit 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.neighbors import calculate_neighbors, calculate_neighbors_reference
+
+def synthetic_layout(count: int, seed: int = 0) -> list:
+    """Dashboard-like layout: rows of boxes on a grid plus random overlapping detections."""
+    rng = random.Random(seed)
+    width = 1920
+    height = max(1080, count * 4)
+    elements = []
+    for i in range(count):
+        if i % 3:
+            col, row = rng.randrange(24), rng.randrange(max(1, count // 8))
+            x1, y1 = col * 80 + rng.randrange(10), row * 32 + rng.randrange(6)
+            box = [x1, y1, x1 + rng.randrange(20, 70), y1 + rng.randrange(12, 26)]
+        else:
+            x1, y1 = rng.randrange(width - 200), rng.randrange(height - 100)
+            box = [x1, y1, x1 + rng.randrange(10, 200), y1 + rng.randrange(10, 100)]
+        elements.append({"id": f"elem{i + 1}", "box": box})
+    return elements
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000])
+    parser.add_argument("--reference-limit", type=int, default=5000,
+                        help="skip the reference implementation above this many boxes")
+    args = parser.parse_args()
+
+    print(f"{'boxes':>7} {'reference':>12} {'sweep':>10} {'speedup':>9}  identical")
+    for size in args.sizes:
+        elements = synthetic_layout(size, seed=size)
+        fast, fast_time = timed(calculate_neighbors, elements)
+        if size > args.reference_limit:
+            print(f"{size:>7} {'skipped':>12} {fast_time:>9.3f}s {'-':>9}  -")
+            continue
+        reference, reference_time = timed(calculate_neighbors_reference, elements)
+        print(f"{size:>7} {reference_time:>11.3f}s {fast_time:>9.3f}s {reference_time / fast_time:>8.1f}x  {fast == reference}")
+
+if __name__ == "__main__":
+    main()
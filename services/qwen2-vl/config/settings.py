@@ -1,3 +1,5 @@
+import os
+
 class Settings:
     MODEL_NAME = "Qwen/Qwen2-VL-72B-Instruct-AWQ"
     MAX_MODEL_LEN = 32768
@@ -6,5 +8,31 @@ class Settings:
     WORKERS = 4
     HOST = "0.0.0.0"
     PORT = 8000
+    # "sync": vllm.LLM behind a lock, "async": AsyncLLMEngine with continuous batching,
+    # "stub": CPU-only stand-in engine with the AsyncLLMEngine interface
+    ENGINE_MODE = os.getenv("ENGINE_MODE", "sync")
+    # Reuse the KV cache of the fixed prompt prefixes in tasks/prompt.py across sequences
+    ENABLE_PREFIX_CACHING = os.getenv("ENABLE_PREFIX_CACHING", "true").lower() == "true"
+    # Log every complete match prompt (one per element group, so very verbose)
+    DEBUG_PROMPTS = os.getenv("DEBUG_PROMPTS", "false").lower() == "true"
+    # Constrain analyze/prefilter/normalize outputs to the JSON schemas in tasks/schemas.py;
+    # the backend (e.g. "outlines", "xgrammar") defaults to vLLM's choice
+    GUIDED_DECODING = os.getenv("GUIDED_DECODING", "true").lower() == "true"
+    GUIDED_DECODING_BACKEND = os.getenv("GUIDED_DECODING_BACKEND") or None
+    # Prefilter: "generate" samples the JSON answer, "score" reads P(true) from the logprobs of one token
+    PREFILTER_MODE = os.getenv("PREFILTER_MODE", "generate")
+    PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.5"))
+    PREFILTER_LOGPROBS = int(os.getenv("PREFILTER_LOGPROBS", "20"))
+    # Platt scaling of the true/false log-odds, fitted offline on labelled prefilter decisions
+    PREFILTER_CALIBRATION_SCALE = float(os.getenv("PREFILTER_CALIBRATION_SCALE", "1.0"))
+    PREFILTER_CALIBRATION_BIAS = float(os.getenv("PREFILTER_CALIBRATION_BIAS", "0.0"))
+    # Screenshot blobs referenced by /analyze/regions and /prefilter/regions: "redis" or "file"
+    BLOB_STORE = os.getenv("BLOB_STORE", "redis")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+    BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/tmp/blobs")
+    DECODED_IMAGE_CACHE_SIZE = int(os.getenv("DECODED_IMAGE_CACHE_SIZE", "8"))
+    # /api/v1/stats: sliding window length and scheduler sampling period, in seconds
+    STATS_WINDOW_SECONDS = float(os.getenv("STATS_WINDOW_SECONDS", "60"))
+    STATS_SAMPLE_INTERVAL = float(os.getenv("STATS_SAMPLE_INTERVAL", "1"))
 
 settings = Settings()
\ No newline at end of file
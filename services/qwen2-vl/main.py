@@ -1,12 +1,24 @@
+import asyncio
 import uvicorn
-import torch.distributed as dist
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routes import analysis, prefilter, match, maintenance, health
+from routes import analysis, prefilter, match, maintenance, health, metrics
 from config.settings import settings
 from models.llm import LLMSingleton
+from tasks.telemetry import TraceMiddleware
+from tasks.stats import engine_stats
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+   sampler = asyncio.create_task(engine_stats.run_sampler(lambda: LLMSingleton().scheduler_state()))
+   try:
+       yield
+   finally:
+       sampler.cancel()
 
 def create_app():
-   app = FastAPI()
+   app = FastAPI(lifespan=lifespan)
+   app.add_middleware(TraceMiddleware, on_request=engine_stats.record_request)
    
    LLMSingleton()
 
@@ -15,11 +27,13 @@ def create_app():
    app.include_router(match.router, prefix="/api/v1")
    app.include_router(maintenance.router, prefix="/api/v1")
    app.include_router(health.router, prefix="/api/v1")
+   app.include_router(metrics.router)
    
    return app
 
 if __name__ == "__main__":
    try:
+       import torch.distributed as dist
        dist.destroy_process_group()
    except:
        pass
@@ -1,10 +1,21 @@
-from vllm import LLM
 import asyncio
-import torch
+import contextlib
+import functools
+import time
+import uuid
 import psutil
 import gc
 from concurrent.futures import ThreadPoolExecutor
+
+try:
+   import torch
+except ImportError:  # stub mode runs without the GPU stack
+   torch = None
+
 from config.settings import settings
+from models.stub import StubAsyncEngine
+from tasks.telemetry import observe_stage, span
+from tasks.stats import engine_stats, vllm_scheduler_state
 
 class LLMSingleton:
    _instance = None
@@ -13,11 +24,32 @@ class LLMSingleton:
    def __new__(cls):
        if cls._instance is None:
            cls._instance = super(LLMSingleton, cls).__new__(cls)
+           cls._instance._init_admission()
            cls._instance._initialize()
        return cls._instance
        
+   def _init_admission(self):
+       # Engine requests in flight, and whether new ones may start; reset() closes
+       # admission and waits for `_idle` before it replaces the engine
+       self._in_flight = 0
+       self._idle = asyncio.Event()
+       self._idle.set()
+       self._admitting = asyncio.Event()
+       self._admitting.set()
+
+   @contextlib.contextmanager
+   def _engine_request(self):
+       self._in_flight += 1
+       self._idle.clear()
+       try:
+           yield
+       finally:
+           self._in_flight -= 1
+           if self._in_flight == 0:
+               self._idle.set()
+
    def _initialize(self):
-       self.llm = LLM(
+       engine_kwargs = dict(
            model=settings.MODEL_NAME,
            trust_remote_code=True,
            dtype="float16",
@@ -25,8 +57,21 @@ class LLMSingleton:
            enforce_eager=True,
            disable_custom_all_reduce=True,
            max_num_batched_tokens=settings.MAX_NUM_BATCHED_TOKENS,
-           max_num_seqs=settings.MAX_NUM_SEQS
+           max_num_seqs=settings.MAX_NUM_SEQS,
+           enable_prefix_caching=settings.ENABLE_PREFIX_CACHING,
+           # Publishes the Prometheus metrics read by scheduler_state (LLM disables them by default)
+           disable_log_stats=False
        )
+       self.engine = None
+       # vLLM is imported per mode so that ENGINE_MODE=stub works without it
+       if settings.ENGINE_MODE == "async":
+           from vllm import AsyncEngineArgs, AsyncLLMEngine
+           self.engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(**engine_kwargs))
+       elif settings.ENGINE_MODE == "stub":
+           self.engine = StubAsyncEngine()
+       else:
+           from vllm import LLM
+           self.llm = LLM(**engine_kwargs)
        self.executor = ThreadPoolExecutor(max_workers=settings.WORKERS)
 
    def _get_detailed_memory_stats(self):
@@ -38,7 +83,7 @@ class LLMSingleton:
            }
        }
        
-       if torch.cuda.is_available():
+       if torch is not None and torch.cuda.is_available():
            memory_stats = torch.cuda.memory_stats()
            
            stats['cuda'] = {
@@ -81,9 +126,29 @@ class LLMSingleton:
 
        return stats
 
+   def scheduler_state(self):
+       """Waiting/running/swapped requests, KV-cache usage and prefix-cache hit rate of the engine.
+
+       Read from vLLM's public Prometheus metrics rather than scheduler
+       internals, which differ between engine versions. Returns None while
+       vLLM publishes no metrics.
+       """
+       if isinstance(self.engine, StubAsyncEngine):
+           return {"waiting": 0, "running": self.engine.in_flight, "swapped": 0, "kv_cache_usage": None,
+                   "prefix_cache_hit_rate": None}
+       return vllm_scheduler_state()
+
    async def reset(self):
+       """Rebuild the engine and free its memory.
+
+       New requests wait while the engine is replaced; requests already
+       streaming from the async engine are drained first, so the old engine
+       is not shut down under them.
+       """
        async with self._lock:
+           self._admitting.clear()
            try:
+               await self._idle.wait()
                before_stats = self._get_detailed_memory_stats()
                print(f"Memory before reset: {before_stats}")
 
@@ -97,12 +162,20 @@ class LLMSingleton:
                if hasattr(self, 'executor'):
                    self.executor.shutdown()
 
-               torch.cuda.empty_cache()
+               if torch is not None and torch.cuda.is_available():
+                   torch.cuda.empty_cache()
                gc.collect()
 
                if hasattr(self, 'llm'):
                    del self.llm
 
+               if self.engine is not None:
+                   try:
+                       self.engine.shutdown_background_loop()
+                   except:
+                       pass
+                   self.engine = None
+
                self._initialize()
                
                after_stats = self._get_detailed_memory_stats()
@@ -119,6 +192,44 @@ class LLMSingleton:
                    'error': str(e),
                    'type': type(e).__name__
                }
+           finally:
+               self._admitting.set()
 
    async def process_request(self, prompts, sampling_params):
-       return await self.llm.generate(prompts, sampling_params)
\ No newline at end of file
+       """Generate completions for a list of prompts, in prompt order.
+
+       With an async engine every prompt becomes its own request, so concurrent
+       routes share continuous batching; reset() waits for these requests. The
+       synchronous LLM is serialized behind the lock and run in the executor to
+       keep the event loop free.
+       """
+       # Waits out a reset, so the engine is never looked at while it is replaced
+       await self._admitting.wait()
+       if self.engine is not None:
+           with self._engine_request():
+               with span("generate"):
+                   outputs = await asyncio.gather(*[
+                       self._generate_one(prompt, sampling_params) for prompt in prompts
+                   ])
+           engine_stats.record_generation(outputs)
+           return outputs
+
+       wait_start = time.perf_counter()
+       async with self._lock:
+           lock_wait = time.perf_counter() - wait_start
+           observe_stage("lock_wait", lock_wait)
+           engine_stats.record_lock_wait(lock_wait)
+           loop = asyncio.get_running_loop()
+           with span("generate"):
+               outputs = await loop.run_in_executor(
+                   self.executor,
+                   functools.partial(self.llm.generate, prompts, sampling_params=sampling_params)
+               )
+       engine_stats.record_generation(outputs)
+       return outputs
+
+   async def _generate_one(self, prompt, sampling_params):
+       final_output = None
+       async for output in self.engine.generate(prompt, sampling_params, uuid.uuid4().hex):
+           final_output = output
+       return final_output
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+class StubSamplingParams:
+    """Stand-in for vllm.SamplingParams; keeps the keyword arguments as attributes."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+@dataclass
+class StubCompletionOutput:
+    text: str
+    index: int = 0
+    token_ids: List[int] = field(default_factory=list)
+    logprobs: Optional[list] = None
+    finish_reason: str = "stop"
+
+@dataclass
+class StubRequestOutput:
+    request_id: str
+    prompt: Any
+    outputs: List[StubCompletionOutput]
+    finished: bool = True
+
+class StubAsyncEngine:
+    """CPU stand-in for vllm.AsyncLLMEngine.
+
+    Implements the same generate(prompt, sampling_params, request_id) async
+    generator so the async engine path can be exercised without a GPU.
+    `responder` maps a prompt to the completion text. Like vLLM, completions
+    longer than max_tokens are cut off with finish_reason "length"; the stub
+    counts one token per character.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Any], str]] = None, delay: float = 0.0):
+        self.responder = responder or (lambda prompt: "{}")
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt, sampling_params, request_id: str):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            text = self.responder(prompt)
+        finally:
+            self.in_flight -= 1
+        finish_reason = "stop"
+        max_tokens = getattr(sampling_params, "max_tokens", None)
+        if max_tokens is not None and len(text) > max_tokens:
+            text, finish_reason = text[:max_tokens], "length"
+        yield StubRequestOutput(
+            request_id=request_id,
+            prompt=prompt,
+            outputs=[StubCompletionOutput(text=text, finish_reason=finish_reason)]
+        )
+
+    async def abort(self, request_id: str):
+        pass
\ No newline at end of file
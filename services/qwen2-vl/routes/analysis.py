@@ -1,21 +1,29 @@
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 from typing import List
 import asyncio
-from vllm import SamplingParams
-from tasks.image import process_image  
-from tasks.json import parse_json_response 
-from tasks.prompt import create_normalization_prompt
+from tasks.image import prepare_images, crop_screenshot
+from tasks.json import TRUNCATED_ERROR, is_truncated, parse_completion
+from tasks.prompt import create_normalization_prompt, normalization_template_version, create_analysis_prompt
+from tasks.regions import crop_regions, BlobNotFoundError
+from tasks.schemas import ANALYSIS_SCHEMA, NORMALIZATION_SCHEMA
+from tasks.sampling import json_sampling_params
 from models.llm import LLMSingleton
 from pydantic import BaseModel
 import json
 from PIL import Image
-import io
 
 router = APIRouter()
 class PromptRequest(BaseModel):
     prompt: str
 
+class Region(BaseModel):
+    image_ref: str
+    box: List[int]
+
+class AnalyzeRegionsRequest(BaseModel):
+    regions: List[Region]
+
 @router.post("/normalize")
 async def normalize_ui_prompt(request: PromptRequest):
     try:
@@ -25,18 +33,22 @@ async def normalize_ui_prompt(request: PromptRequest):
         
         print("1. REQUEST:", request.prompt)
         
-        async with llm_singleton._lock:
-            outputs = llm_singleton.llm.generate(
-                prompts=[formatted_prompt],
-                sampling_params=SamplingParams(temperature=0.1, max_tokens=256)
-            )
-            print("2. VLLM OUTPUT:", outputs)
-            
-            if outputs and len(outputs) > 0:
-                raw_text = outputs[0].outputs[0].text.strip()
-                print("3. RAW TEXT:", raw_text)
-                result = json.loads(raw_text)
-                return JSONResponse(content=result)
+        outputs = await llm_singleton.process_request(
+            [formatted_prompt],
+            json_sampling_params(NORMALIZATION_SCHEMA, temperature=0.1, max_tokens=256)
+        )
+        print("2. VLLM OUTPUT:", outputs)
+        
+        if outputs and len(outputs) > 0:
+            raw_text = outputs[0].outputs[0].text.strip()
+            print("3. RAW TEXT:", raw_text)
+            if is_truncated(outputs[0].outputs[0]):
+                return JSONResponse(
+                    status_code=500,
+                    content={"error": TRUNCATED_ERROR, "type": "OutputTruncated", "raw_response": raw_text}
+                )
+            result = json.loads(raw_text)
+            return JSONResponse(content=result)
                 
         return JSONResponse(
             status_code=500,
@@ -52,45 +64,69 @@ async def normalize_ui_prompt(request: PromptRequest):
             content={"error": str(e), "type": type(e).__name__, "trace": traceback.format_exc()}
         )
 
+@router.get("/normalize/version")
+async def normalize_template_version():
+    return JSONResponse(content={"version": normalization_template_version()})
+
 @router.post("/analyze")
 async def analyze_ui_element(images: List[UploadFile] = File(...)):
     try:
         image_contents = await asyncio.gather(*[image.read() for image in images])
-        
-        processed_images = []
-        for img_content in image_contents:
-            img_io = io.BytesIO(img_content)
-            with Image.open(img_io) as img:
-                img = img.convert("RGB")
-                w, h = img.size
-                pad_w = max(0, 28 - w)
-                pad_h = max(0, 28 - h)
-                
-                if pad_w > 0 or pad_h > 0:
-                    new_w = max(w, 28)
-                    new_h = max(h, 28)
-                    padded_img = Image.new('RGB', (new_w, new_h), 'white')
-                    padded_img.paste(img, (0, 0))
-                    img = padded_img
-                
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='PNG')
-                processed_images.append(img_byte_arr.getvalue())
+        processed_images = await prepare_images(image_contents, LLMSingleton().executor)
 
-        batch_inputs = await asyncio.gather(*[process_image(image) for image in processed_images])
+        results = await analyze_crops(processed_images)
+        return JSONResponse(content=results[0] if len(results) == 1 else results)
 
-        llm_singleton = LLMSingleton()
-        async with llm_singleton._lock:
-            outputs = llm_singleton.llm.generate(
-                batch_inputs,
-                sampling_params=SamplingParams(temperature=0.2, max_tokens=512)
-            )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500, 
+            content={"error": str(e), "type": type(e).__name__}
+        )
 
-        results = await asyncio.gather(*[parse_json_response(output.outputs[0].text) for output in outputs])
-        return JSONResponse(content=results[0] if len(results) == 1 else results)
+async def analyze_crops(crops: List[Image.Image]) -> List[dict]:
+    batch_inputs = [
+        {"prompt": create_analysis_prompt(), "multi_modal_data": {"image": crop}}
+        for crop in crops
+    ]
+
+    llm_singleton = LLMSingleton()
+    outputs = await llm_singleton.process_request(
+        batch_inputs,
+        json_sampling_params(ANALYSIS_SCHEMA, temperature=0.2, max_tokens=512)
+    )
+
+    return await asyncio.gather(*[parse_completion(output.outputs[0]) for output in outputs])
+
+@router.post("/analyze/regions")
+async def analyze_ui_regions(request: AnalyzeRegionsRequest):
+    try:
+        crops = await crop_regions(
+            [region.image_ref for region in request.regions],
+            [region.box for region in request.regions],
+            LLMSingleton().executor
+        )
+        return JSONResponse(content=await analyze_crops(crops))
+
+    except BlobNotFoundError as e:
+        return JSONResponse(
+            status_code=404,
+            content={"error": str(e), "type": type(e).__name__}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500, 
+            content={"error": str(e), "type": type(e).__name__}
+        )
+
+@router.post("/analyze/crops")
+async def analyze_ui_crops(image: UploadFile = File(...), boxes: str = Form(...)):
+    """One full screenshot plus a JSON list of [x1, y1, x2, y2] boxes, cropped in memory."""
+    try:
+        crops = await crop_screenshot(await image.read(), json.loads(boxes), LLMSingleton().executor)
+        return JSONResponse(content=await analyze_crops(crops))
 
     except Exception as e:
         return JSONResponse(
             status_code=500, 
             content={"error": str(e), "type": type(e).__name__}
-        )
\ No newline at end of file
+        )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from models.llm import LLMSingleton
+from tasks.stats import engine_stats
 
 router = APIRouter()
 
@@ -14,4 +15,13 @@ async def health_check():
        return JSONResponse(
            status_code=503,
            content={"status": "unavailable", "error": str(e)}
-       )
\ No newline at end of file
+       )
+
+@router.get("/stats")
+async def engine_statistics():
+   try:
+       current = LLMSingleton().scheduler_state()
+   except Exception as e:
+       print(f"Reading scheduler state failed: {e}")
+       current = None
+   return JSONResponse(content=engine_stats.snapshot(current))
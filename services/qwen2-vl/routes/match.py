@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Dict, List, Optional
-from vllm import SamplingParams
 from models.llm import LLMSingleton
+from tasks.prompt import create_comparison_prompt
+from tasks.sampling import SamplingParams
 
 router = APIRouter()
 
@@ -38,49 +39,20 @@ class PromptMatch(BaseModel):
    normalized_prompt: dict
    elements: List[UIElement]
 
-def create_comparison_prompt(base_prompt: dict, elements: List[UIElement]) -> str:
-   elements_processed = [e.dict() for e in elements]
-   
-   # Format target description
-   target_formatted = "\n".join(f"- {k}: {v}" for k,v in base_prompt.items())
-   
-   # Format elements
-   elements_formatted = ""
-   for e in elements_processed:
-       elements_formatted += f"\nElement:\n"
-       for k,v in e.items():
-           if k == 'neighbors':
-               elements_formatted += f"- {k}:\n"
-               for pos, n in v.items():
-                   elements_formatted += f"  {pos}:\n"
-                   for nk, nv in n.items():
-                       elements_formatted += f"    {nk}: {nv}\n"
-           else:
-               elements_formatted += f"- {k}: {v}\n"
-   
-   prompt = (
-       "<|im_start|>system\n"
-       "You are a precise UI element matching system. Your task is to find the exact element that best matches "
-       "the target description. Pay special attention to:\n"
-       "- Exact type matches (button, text, icon etc)\n"
-       "- Visual elements and their specific descriptions\n"
-       "- Text content and phrasing\n"
-       "- Color nuances\n"
-       "- Primary function and purpose\n"
-       "- Contextual placement if neighbors exist\n\n"
-       "Analyze each element thoroughly before deciding. Return ONLY the id of the best matching element.\n"
-       "<|im_end|>\n"
-       "<|im_start|>user\n"
-       f"Target Description:\n{target_formatted}\n\n"
-       f"Available Elements:{elements_formatted}\n\n"
-       "Which element id matches the target description most precisely?\n"
-       "<|im_end|>\n"
-       "<|im_start|>assistant\n"
-   )
-   
-   print("\nDebug - Complete Prompt:")
-   print(prompt)
-   return prompt
+class PromptMatchBatch(BaseModel):
+   normalized_prompt: dict
+   groups: List[List[UIElement]]
+
+def extract_match_id(raw_match_id: str, elements: List[UIElement]):
+   if "none" in raw_match_id.lower() or "no match" in raw_match_id.lower():
+       return False
+
+   match_id = raw_match_id.replace('"','').replace("'","").strip()
+
+   if not any(e.id == match_id for e in elements):
+       return False
+
+   return match_id
 
 @router.post("/match")
 async def match_elements(request: PromptMatch):
@@ -88,33 +60,56 @@ async def match_elements(request: PromptMatch):
        llm_singleton = LLMSingleton()
        prompt = create_comparison_prompt(
            request.normalized_prompt,
-           request.elements
+           [e.dict() for e in request.elements]
        )
        
-       async with llm_singleton._lock:
-           output = llm_singleton.llm.generate(
-               prompts=[prompt],
-               sampling_params=SamplingParams(
-                   temperature=0.1,
-                   max_tokens=32
-               )
+       output = await llm_singleton.process_request(
+           [prompt],
+           SamplingParams(
+               temperature=0.1,
+               max_tokens=32
            )
+       )
+       
+       raw_match_id = output[0].outputs[0].text.strip()
+       print(f"\nRaw LLM output: {raw_match_id}")
+       
+       return {"match_id": extract_match_id(raw_match_id, request.elements)}
            
-           raw_match_id = output[0].outputs[0].text.strip()
-           print(f"\nRaw LLM output: {raw_match_id}")
-           
-           if "none" in raw_match_id.lower() or "no match" in raw_match_id.lower():
-               return {"match_id": False}
-               
-           match_id = raw_match_id.replace('"','').replace("'","").strip()
-           
-           if not any(e.id == match_id for e in request.elements):
-               return {"match_id": False}
-               
-           return {"match_id": match_id}
-           
    except Exception as e:
        return {
            "error": str(e),
            "type": type(e).__name__
-       }
\ No newline at end of file
+       }
+
+@router.post("/match/batch")
+async def match_elements_batch(request: PromptMatchBatch):
+   try:
+       if not request.groups:
+           return {"match_ids": []}
+
+       llm_singleton = LLMSingleton()
+       prompts = [
+           create_comparison_prompt(request.normalized_prompt, [e.dict() for e in elements])
+           for elements in request.groups
+       ]
+
+       outputs = await llm_singleton.process_request(
+           prompts,
+           SamplingParams(
+               temperature=0.1,
+               max_tokens=32
+           )
+       )
+
+       match_ids = [
+           extract_match_id(output.outputs[0].text.strip(), elements)
+           for output, elements in zip(outputs, request.groups)
+       ]
+       return {"match_ids": match_ids}
+
+   except Exception as e:
+       return {
+           "error": str(e),
+           "type": type(e).__name__
+       }
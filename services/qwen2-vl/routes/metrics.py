@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+from tasks.telemetry import metrics_response
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def metrics():
+   return metrics_response()
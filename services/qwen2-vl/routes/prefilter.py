@@ -1,16 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import base64
+from pydantic import BaseModel, conint
+from typing import List, Dict, Any, Literal, Optional
+import json
 import asyncio
-from PIL import Image
-import io
-from vllm import SamplingParams
-from tasks.image import process_image
-from tasks.json import parse_json_response
+from config.settings import settings
+from tasks.image import prepare_images, crop_screenshot
+from tasks.json import parse_completion
 from models.llm import LLMSingleton
 from tasks.prompt import create_prefilter_prompt
+from tasks.regions import crop_regions, BlobNotFoundError
+from tasks.schemas import PREFILTER_SCHEMA
+from tasks.sampling import SamplingParams, json_sampling_params
+from tasks.scoring import score_output, select_sections
 
 
 router = APIRouter()
@@ -24,58 +26,108 @@ class Section(BaseModel):
     position_metadata: PositionMetadata
     image: str
 
-class PrefilterRequest(BaseModel):
+class PrefilterOptions(BaseModel):
     normalized_prompt: Dict[str, Any]
+    # "generate" or "score"; defaults to PREFILTER_MODE
+    mode: Optional[Literal["generate", "score"]] = None
+    # Minimum score for likely_contains; defaults to PREFILTER_THRESHOLD
+    threshold: Optional[float] = None
+    # Keep only the k best-scoring sections above the threshold; 0 or None keeps all, as PREFILTER_TOP_K does
+    top_k: Optional[conint(ge=0)] = None
+
+class PrefilterRequest(PrefilterOptions):
     sections: List[Section]
 
+class RegionSection(BaseModel):
+    position_metadata: PositionMetadata
+    image_ref: str
+    box: List[int]
+
+class PrefilterRegionsRequest(PrefilterOptions):
+    sections: List[RegionSection]
+
+class BoxSection(BaseModel):
+    position_metadata: PositionMetadata
+    box: List[int]
+
+class PrefilterCropsRequest(PrefilterOptions):
+    sections: List[BoxSection]
+
 @router.post("/prefilter")
 async def prefilter_sections(request: PrefilterRequest):
     try:
         sections = request.sections
-        batch_inputs = []
-        
-        for section in sections:
-            image_bytes = base64.b64decode(section.image)
-            img_io = io.BytesIO(image_bytes)
-            with Image.open(img_io) as img:
-                img = img.convert("RGB")
-                w, h = img.size
-                pad_w = max(0, 28 - w)
-                pad_h = max(0, 28 - h)
-                
-                if pad_w > 0 or pad_h > 0:
-                    new_w = max(w, 28)
-                    new_h = max(h, 28)
-                    padded_img = Image.new('RGB', (new_w, new_h), 'white')
-                    padded_img.paste(img, (0, 0))
-                    img = padded_img
-                
-                # Convert back to bytes for process_image
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='PNG')
-                image_data = img_byte_arr.getvalue()
-                
-            processed = await process_image(image_data)
-            processed["prompt"] = create_prefilter_prompt(request.normalized_prompt)
-            batch_inputs.append(processed)
-
-        llm_singleton = LLMSingleton()
-        async with llm_singleton._lock:
-            outputs = llm_singleton.llm.generate(
-                batch_inputs,
-                sampling_params=SamplingParams(temperature=0.1, max_tokens=128)
-            )
-
-        results = []
-        for idx, output in enumerate(outputs):
-            parsed = await parse_json_response(output.outputs[0].text)
-            results.append({
-                "section_index": idx,
-                "position_metadata": sections[idx].position_metadata.dict(),
-                "likely_contains": parsed.get("contains", False)
-            })
-
-        return JSONResponse(content={"results": results})
+        # Base64 decoding happens in the executor along with the image decode.
+        images = await prepare_images([section.image for section in sections], LLMSingleton().executor)
+        return await run_prefilter(request, images)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/prefilter/regions")
+async def prefilter_regions(request: PrefilterRegionsRequest):
+    try:
+        sections = request.sections
+        crops = await crop_regions(
+            [section.image_ref for section in sections],
+            [section.box for section in sections],
+            LLMSingleton().executor
+        )
+        return await run_prefilter(request, crops)
+
+    except BlobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/prefilter/crops")
+async def prefilter_crops(image: UploadFile = File(...), request: str = Form(...)):
+    """One full screenshot plus the prefilter request as JSON, with a box per section."""
+    try:
+        prefilter_request = PrefilterCropsRequest(**json.loads(request))
+        sections = prefilter_request.sections
+        crops = await crop_screenshot(await image.read(), [section.box for section in sections], LLMSingleton().executor)
+        return await run_prefilter(prefilter_request, crops)
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def run_prefilter(request: PrefilterOptions, crops: List) -> JSONResponse:
+    """Score every crop against the prompt and mark the sections to keep.
+
+    In "score" mode each section costs one forward pass: the answer is primed
+    up to the boolean and P(true) is read from the logprobs of the next token.
+    In "generate" mode the JSON answer is sampled and scores are 1.0 or 0.0.
+    """
+    llm_singleton = LLMSingleton()
+    scored = (request.mode or settings.PREFILTER_MODE) == "score"
+    prompt = create_prefilter_prompt(request.normalized_prompt, scored=scored)
+    batch_inputs = [{"prompt": prompt, "multi_modal_data": {"image": crop}} for crop in crops]
+
+    if scored:
+        outputs = await llm_singleton.process_request(
+            batch_inputs,
+            SamplingParams(temperature=0.0, max_tokens=1, logprobs=settings.PREFILTER_LOGPROBS)
+        )
+        scores = [score_output(output) for output in outputs]
+    else:
+        outputs = await llm_singleton.process_request(
+            batch_inputs,
+            json_sampling_params(PREFILTER_SCHEMA, temperature=0.1, max_tokens=128)
+        )
+        parsed = await asyncio.gather(*[parse_completion(output.outputs[0]) for output in outputs])
+        scores = [1.0 if result.get("contains", False) else 0.0 for result in parsed]
+
+    threshold = settings.PREFILTER_THRESHOLD if request.threshold is None else request.threshold
+    keep = select_sections(scores, threshold, request.top_k)
+
+    results = []
+    for idx, section in enumerate(request.sections):
+        results.append({
+            "section_index": idx,
+            "position_metadata": section.position_metadata.dict(),
+            "likely_contains": keep[idx],
+            "score": round(scores[idx], 4)
+        })
+
+    return JSONResponse(content={"results": results})
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+import asyncio
+from typing import Optional
+import redis.asyncio as redis
+from config.settings import settings
+
+class RedisBlobStore:
+    """Read side of the content-addressed screenshot store written by mask-generation and the workflow-engine."""
+
+    def __init__(self, url: str, prefix: str = "blob:"):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+class FileBlobStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.directory, os.path.basename(key)), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+
+_store = None
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        if settings.BLOB_STORE == "file":
+            _store = FileBlobStore(settings.BLOB_STORE_DIR)
+        else:
+            _store = RedisBlobStore(settings.REDIS_URL)
+    return _store
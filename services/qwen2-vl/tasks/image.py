@@ -1,16 +1,49 @@
-from PIL import Image
+import asyncio
+import base64
+import functools
 import io
-import contextlib
-from tasks.prompt import create_analysis_prompt
-
-async def process_image(image_data: bytes) -> dict:
-    """Process a single image asynchronously."""
-    try:
-        with contextlib.closing(Image.open(io.BytesIO(image_data))) as img:
-            img = img.convert("RGB")
-            return {
-                "prompt": create_analysis_prompt(),
-                "multi_modal_data": {"image": img}
-            }
-    except Exception as e:
-        raise
+from concurrent.futures import Executor
+from typing import List, Sequence, Union
+from PIL import Image
+from tasks.telemetry import span
+
+MIN_IMAGE_SIZE = 28
+
+def decode_image(data: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert("RGB")
+
+def pad_image(img: Image.Image) -> Image.Image:
+    """Pad to at least MIN_IMAGE_SIZE on both sides, the smallest input the vision encoder accepts."""
+    w, h = img.size
+    if w >= MIN_IMAGE_SIZE and h >= MIN_IMAGE_SIZE:
+        return img
+    padded_img = Image.new('RGB', (max(w, MIN_IMAGE_SIZE), max(h, MIN_IMAGE_SIZE)), 'white')
+    padded_img.paste(img, (0, 0))
+    return padded_img
+
+def prepare_image(data: Union[bytes, str]) -> Image.Image:
+    """Decode (raw or base64) image bytes into a padded RGB image, ready for multi_modal_data."""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return pad_image(decode_image(data))
+
+def crop_boxes(image: Image.Image, boxes: Sequence[List[int]]) -> List[Image.Image]:
+    """Crop every box from one decoded screenshot."""
+    return [pad_image(image.crop(tuple(box))) for box in boxes]
+
+async def prepare_images(images: Sequence[Union[bytes, str]], executor: Executor) -> List[Image.Image]:
+    """prepare_image for a batch, one executor job per image so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    with span("preprocess"):
+        return await asyncio.gather(*[loop.run_in_executor(executor, prepare_image, data) for data in images])
+
+async def crop_screenshot(data: bytes, boxes: Sequence[List[int]], executor: Executor) -> List[Image.Image]:
+    """Decode one screenshot and crop the boxes from it in the executor."""
+    loop = asyncio.get_running_loop()
+    with span("preprocess"):
+        return await loop.run_in_executor(executor, lambda: crop_boxes(decode_image(data), boxes))
+
+async def run_in_executor(executor: Executor, fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args))
@@ -14,3 +14,14 @@ async def parse_json_response(response_text: str) -> dict:
         )
     except json.JSONDecodeError as e:
         return {"error": "Invalid JSON response", "raw_response": response_text}
+
+TRUNCATED_ERROR = "Output truncated at max_tokens"
+
+def is_truncated(completion) -> bool:
+    return getattr(completion, "finish_reason", None) == "length"
+
+async def parse_completion(completion) -> dict:
+    """Parse a JSON completion; one cut off at max_tokens is reported as truncated, not as invalid JSON."""
+    if is_truncated(completion):
+        return {"error": TRUNCATED_ERROR, "raw_response": completion.text}
+    return await parse_json_response(completion.text)
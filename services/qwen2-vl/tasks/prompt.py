@@ -1,20 +1,32 @@
+import hashlib
+import json
+from typing import Dict, List
+from config.settings import settings
+from tasks.schemas import NORMALIZATION_SCHEMA
+
+# Prompts are built as a fixed prefix followed by the per-request part. With
+# ENABLE_PREFIX_CACHING, vLLM reuses the KV cache of every full block of a
+# byte-identical prefix, so each prefix below is prefilled once and then shared
+# by all sequences. Nothing variable may be interpolated into a prefix.
+
+ANALYSIS_PREFIX = (
+    "<|im_start|>system\n"
+    "You are a precise UI element analyzer. Extract information ONLY from what you can see.\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+    "Example output format:\n"
+    "{\n"
+    '    "type": "button|icon|text|input",\n'
+    '    "text": "exact text if present, null if none",\n'
+    '    "visual_elements": ["icon names or descriptions if present else put none"],\n'
+    '    "primary_function": "main purpose based on visual evidence only make two sentence",\n'
+    '    "dominant_color": "main color if clearly visible, null if unclear"\n'
+    "}\n\n"
+)
+
 def create_analysis_prompt() -> str:
-    base_prompt = (
-        "<|im_start|>system\n"
-        "You are a precise UI element analyzer. Extract information ONLY from what you can see.\n"
-        "<|im_end|>\n"
-        "<|im_start|>user\n"
-        "Example output format:\n"
-        "{\n"
-        '    "type": "button|icon|text|input",\n'
-        '    "text": "exact text if present, null if none",\n'
-        '    "visual_elements": ["icon names or descriptions if present else put none"],\n'
-        '    "primary_function": "main purpose based on visual evidence only make two sentence",\n'
-        '    "dominant_color": "main color if clearly visible, null if unclear"\n'
-        "}\n\n"
-    )
     return (
-        f"{base_prompt}"
+        f"{ANALYSIS_PREFIX}"
         "<|vision_start|>"
         "<|image_pad|>"
         "<|vision_end|>\n"
@@ -23,77 +35,150 @@ def create_analysis_prompt() -> str:
         "<|im_start|>assistant\n"
     )
 
+NORMALIZATION_PREFIX = (
+    "<|im_start|>system\n"
+    "Extract UI properties with focus on function and context.\n"
+    "For neighbors use ONLY these directions: \"left\", \"right\", \"above\", \"below\", \"undefined\". Other positions are invalid.\n"
+    "Always include a brief functional summary based on all available information.\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+    "Find me a blue phone button with phone icon\n"
+    "<|im_end|>\n"
+    "<|im_start|>assistant\n"
+    "{{\n"
+    "  \"type\": \"button\",\n"
+    "  \"primary_function\": \"initiate calls/communication\",\n"
+    "  \"color\": \"blue\",\n"
+    "  \"visual_elements\": [\"phone icon\"],\n"
+    "  \"derived_intent\": \"make a phone call\"\n"
+    "}}\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+    "Find me a green phone button with text call next to settings\n"
+    "<|im_end|>\n"
+    "<|im_start|>assistant\n"
+    "{{\n"
+    "  \"type\": \"button\",\n"
+    "  \"text\": \"call\",\n"
+    "  \"primary_function\": \"initiate calls/communication\",\n"
+    "  \"color\": \"green\",\n"
+    "  \"neighbors\": {{\n"
+    "    \"right\": {{\n"
+    "      \"type\": \"text\",\n"
+    "      \"text\": \"settings\"\n"
+    "    }}\n"
+    "  }},\n"
+    "  \"derived_intent\": \"access phone functionality near settings\"\n"
+    "}}\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+
 def create_normalization_prompt() -> str:
-    template = (
-        "<|im_start|>system\n"
-        "Extract UI properties with focus on function and context.\n"
-        "For neighbors use ONLY these directions: \"left\", \"right\", \"above\", \"below\", \"undefined\". Other positions are invalid.\n"
-        "Always include a brief functional summary based on all available information.\n"
-        "<|im_end|>\n"
-        "<|im_start|>user\n"
-        "Find me a blue phone button with phone icon\n"
-        "<|im_end|>\n"
-        "<|im_start|>assistant\n"
-        "{{\n"
-        "  \"type\": \"button\",\n"
-        "  \"primary_function\": \"initiate calls/communication\",\n"
-        "  \"color\": \"blue\",\n"
-        "  \"visual_elements\": [\"phone icon\"],\n"
-        "  \"derived_intent\": \"make a phone call\"\n"
-        "}}\n"
-        "<|im_end|>\n"
-        "<|im_start|>user\n"
-        "Find me a green phone button with text call next to settings\n"
-        "<|im_end|>\n"
-        "<|im_start|>assistant\n"
-        "{{\n"
-        "  \"type\": \"button\",\n"
-        "  \"text\": \"call\",\n"
-        "  \"primary_function\": \"initiate calls/communication\",\n"
-        "  \"color\": \"green\",\n"
-        "  \"neighbors\": {{\n"
-        "    \"right\": {{\n"
-        "      \"type\": \"text\",\n"
-        "      \"text\": \"settings\"\n"
-        "    }}\n"
-        "  }},\n"
-        "  \"derived_intent\": \"access phone functionality near settings\"\n"
-        "}}\n"
-        "<|im_end|>\n"
-        "<|im_start|>user\n"
+    """Template with a `{0}` slot for the user prompt, filled with str.format."""
+    return (
+        f"{NORMALIZATION_PREFIX}"
         "Normalize: {0}\n"
         "<|im_end|>\n"
         "<|im_start|>assistant\n"
     )
-    return template
-
-
-def create_prefilter_prompt(normalized_prompt: dict) -> str:
-    base_prompt = (
-        "<|im_start|>system\n"
-        "You are an extremely lenient UI section analyzer. Your goal is to INCLUDE as many potential matches as possible.\n"
-        "IMPORTANT: When in doubt, ALWAYS return true. Only return false if you are 100% certain there is NO possibility of a match.\n"
-        "Matching rules:\n"
-        "- ANY interactive element could be a potential match\n"
-        "- ANY color should be considered similar enough\n"
-        "- Positions are just rough guidelines\n"
-        "- Text matching should allow for variations\n"
-        "- Missing attributes should be ignored completely\n"
-        "- Different shapes/sizes are acceptable\n"
-        "- Different visual styles are acceptable\n"
-        "<|im_end|>\n"
-        "<|im_start|>user\n"
-        f"Find ANY UI elements that could potentially match this description: {str(normalized_prompt)}\n"
+
+
+def normalization_template_version() -> str:
+    """Short content hash of the normalization template; changes whenever the template does.
+
+    With guided decoding the output schema shapes the result too, so it is hashed along.
+    """
+    content = create_normalization_prompt()
+    if settings.GUIDED_DECODING:
+        content += json.dumps(NORMALIZATION_SCHEMA, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:12]
+
+
+PREFILTER_PREFIX = (
+    "<|im_start|>system\n"
+    "You are an extremely lenient UI section analyzer. Your goal is to INCLUDE as many potential matches as possible.\n"
+    "IMPORTANT: When in doubt, ALWAYS return true. Only return false if you are 100% certain there is NO possibility of a match.\n"
+    "Matching rules:\n"
+    "- ANY interactive element could be a potential match\n"
+    "- ANY color should be considered similar enough\n"
+    "- Positions are just rough guidelines\n"
+    "- Text matching should allow for variations\n"
+    "- Missing attributes should be ignored completely\n"
+    "- Different shapes/sizes are acceptable\n"
+    "- Different visual styles are acceptable\n"
+    "Answer whether the section shown could contain anything similar to the description. Return JSON:\n"
+    "{\n"
+    '    "contains": true|false\n'
+    "}\n"
+    "REMEMBER: Default to true unless absolutely certain!\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+    "Find ANY UI elements that could potentially match this description: "
+)
+
+# Opens the assistant's JSON answer so that the next token is the true/false answer itself.
+PREFILTER_SCORE_PRIMER = '{\n    "contains":'
+
+def create_prefilter_prompt(normalized_prompt: dict, scored: bool = False) -> str:
+    # The description follows the prefix and precedes the image, so every section of a
+    # batch also shares the prefill of the description.
+    prompt = (
+        f"{PREFILTER_PREFIX}"
+        f"{str(normalized_prompt)}\n"
         "Remember: When unsure, include it!\n"
         "<|vision_start|>"
         "<|image_pad|>"
         "<|vision_end|>\n"
-        "Could this section contain anything similar? Return JSON:\n"
-        "{\n"
-        '    "contains": true|false\n'
-        "}\n"
-        "REMEMBER: Default to true unless absolutely certain!\n"
+        "Could this section contain anything similar?\n"
         "<|im_end|>\n"
         "<|im_start|>assistant\n"
     )
-    return base_prompt
\ No newline at end of file
+    return prompt + PREFILTER_SCORE_PRIMER if scored else prompt
+
+COMPARISON_PREFIX = (
+    "<|im_start|>system\n"
+    "You are a precise UI element matching system. Your task is to find the exact element that best matches "
+    "the target description. Pay special attention to:\n"
+    "- Exact type matches (button, text, icon etc)\n"
+    "- Visual elements and their specific descriptions\n"
+    "- Text content and phrasing\n"
+    "- Color nuances\n"
+    "- Primary function and purpose\n"
+    "- Contextual placement if neighbors exist\n\n"
+    "Analyze each element thoroughly before deciding. Return ONLY the id of the best matching element.\n"
+    "<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+
+def format_elements(elements: List[Dict]) -> str:
+    elements_formatted = ""
+    for e in elements:
+        elements_formatted += f"\nElement:\n"
+        for k, v in e.items():
+            if k == 'neighbors':
+                elements_formatted += f"- {k}:\n"
+                for pos, n in v.items():
+                    elements_formatted += f"  {pos}:\n"
+                    for nk, nv in n.items():
+                        elements_formatted += f"    {nk}: {nv}\n"
+            else:
+                elements_formatted += f"- {k}: {v}\n"
+    return elements_formatted
+
+def create_comparison_prompt(base_prompt: dict, elements: List[Dict]) -> str:
+    """Match prompt for one group; the target description is shared by all groups of a batch."""
+    target_formatted = "\n".join(f"- {k}: {v}" for k, v in base_prompt.items())
+    prompt = (
+        f"{COMPARISON_PREFIX}"
+        f"Target Description:\n{target_formatted}\n\n"
+        f"Available Elements:{format_elements(elements)}\n\n"
+        "Which element id matches the target description most precisely?\n"
+        "<|im_end|>\n"
+        "<|im_start|>assistant\n"
+    )
+
+    if settings.DEBUG_PROMPTS:
+        print("\nDebug - Complete Prompt:")
+        print(prompt)
+    return prompt
\ No newline at end of file
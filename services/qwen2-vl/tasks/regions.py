@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import List, Sequence
+from PIL import Image
+from config.settings import settings
+from tasks.blobstore import get_blob_store
+from tasks.image import decode_image, pad_image, run_in_executor
+from tasks.telemetry import span
+
+class BlobNotFoundError(LookupError):
+    pass
+
+_decoded = OrderedDict()
+
+async def load_image(image_ref: str, executor: Executor) -> Image.Image:
+    """Decoded RGB screenshot for a blob reference, kept in a small LRU across requests."""
+    if image_ref in _decoded:
+        _decoded.move_to_end(image_ref)
+        return _decoded[image_ref]
+
+    data = await get_blob_store().get(image_ref)
+    if data is None:
+        raise BlobNotFoundError(f"Image {image_ref} not found in blob store")
+    image = await run_in_executor(executor, decode_image, data)
+
+    _decoded[image_ref] = image
+    while len(_decoded) > settings.DECODED_IMAGE_CACHE_SIZE:
+        _decoded.popitem(last=False)
+    return image
+
+async def crop_regions(image_refs: Sequence[str], boxes: Sequence[List[int]], executor: Executor) -> List[Image.Image]:
+    """Crop each box from its referenced screenshot; every screenshot is decoded once."""
+    images = {}
+    with span("blob_load"):
+        for image_ref in image_refs:
+            if image_ref not in images:
+                images[image_ref] = await load_image(image_ref, executor)
+
+    def crop_all():
+        return [pad_image(images[image_ref].crop(tuple(box))) for image_ref, box in zip(image_refs, boxes)]
+    with span("preprocess"):
+        return await run_in_executor(executor, crop_all)
@@ -0,0 +1,32 @@
+from typing import Optional
+from config.settings import settings
+from tasks.schemas import max_output_length
+
+if settings.ENGINE_MODE == "stub":
+    # The stub engine ignores sampling parameters, so stub mode does not need vLLM
+    from models.stub import StubSamplingParams as SamplingParams
+    GuidedDecodingParams = None
+else:
+    from vllm import SamplingParams
+    try:
+        from vllm.sampling_params import GuidedDecodingParams
+    except ImportError:
+        GuidedDecodingParams = None
+
+def json_sampling_params(schema: Optional[dict], **kwargs) -> SamplingParams:
+    """SamplingParams that, with GUIDED_DECODING, constrain the output to `schema`.
+
+    Constrained outputs end at the closing brace instead of running on to
+    max_tokens, and max_tokens is raised to max_output_length(schema). That
+    covers plain outputs; escaped characters or extra whitespace can still
+    reach the limit, which callers see as finish_reason "length"
+    (tasks/json.py). vLLM versions without GuidedDecodingParams fall back to
+    free generation.
+    """
+    if schema is not None and settings.GUIDED_DECODING and GuidedDecodingParams is not None:
+        guided = {"json": schema}
+        if settings.GUIDED_DECODING_BACKEND:
+            guided["backend"] = settings.GUIDED_DECODING_BACKEND
+        kwargs["guided_decoding"] = GuidedDecodingParams(**guided)
+        kwargs["max_tokens"] = max(kwargs.get("max_tokens") or 0, max_output_length(schema))
+    return SamplingParams(**kwargs)
@@ -0,0 +1,84 @@
+# JSON schemas of the model outputs, used for guided decoding (tasks/sampling.py)
+import json
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "maxLength": 32},
+        "text": {"type": ["string", "null"], "maxLength": 200},
+        "visual_elements": {"type": "array", "items": {"type": "string", "maxLength": 80}, "maxItems": 8},
+        "primary_function": {"type": "string", "maxLength": 300},
+        "dominant_color": {"type": ["string", "null"], "maxLength": 32}
+    },
+    "required": ["type", "text", "visual_elements", "primary_function", "dominant_color"],
+    "additionalProperties": False
+}
+
+PREFILTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "contains": {"type": "boolean"}
+    },
+    "required": ["contains"],
+    "additionalProperties": False
+}
+
+# Normalization describes the user's request, not the screen, so its caps are
+# tighter than ANALYSIS_SCHEMA's
+NEIGHBOR_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "maxLength": 32},
+        "text": {"type": "string", "maxLength": 60}
+    },
+    "additionalProperties": False
+}
+
+NORMALIZATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "maxLength": 32},
+        "text": {"type": "string", "maxLength": 80},
+        "primary_function": {"type": "string", "maxLength": 120},
+        "color": {"type": "string", "maxLength": 32},
+        "visual_elements": {"type": "array", "items": {"type": "string", "maxLength": 40}, "maxItems": 4},
+        "neighbors": {
+            "type": "object",
+            "properties": {
+                direction: NEIGHBOR_SCHEMA for direction in ("left", "right", "above", "below", "undefined")
+            },
+            "additionalProperties": False
+        },
+        "derived_intent": {"type": "string", "maxLength": 120}
+    },
+    "required": ["type", "primary_function", "derived_intent"],
+    "additionalProperties": False
+}
+
+def _longest_instance(schema: dict):
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    candidates = []
+    for kind in types:
+        if kind == "object":
+            candidates.append({name: _longest_instance(prop) for name, prop in schema.get("properties", {}).items()})
+        elif kind == "array":
+            candidates.append([_longest_instance(schema["items"])] * schema["maxItems"])
+        elif kind == "string":
+            candidates.append("x" * schema["maxLength"])
+        elif kind == "boolean":
+            candidates.append(False)
+        elif kind == "null":
+            candidates.append(None)
+    return max(candidates, key=lambda candidate: len(json.dumps(candidate)))
+
+def max_output_length(schema: dict) -> int:
+    """Characters of the longest output `schema` allows, indented like the few-shot examples.
+
+    Every token decodes to at least one character, so this bounds the tokens
+    of an output without JSON escapes and without extra whitespace. maxLength
+    counts decoded characters, and an escaped character (\\" or \\uXXXX) takes
+    up to 6 characters of output; backends that allow any whitespace can pad
+    it further. Such outputs can still be truncated. Requires maxLength on
+    every string and maxItems on every array.
+    """
+    return len(json.dumps(_longest_instance(schema), indent=2))
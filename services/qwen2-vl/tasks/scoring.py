@@ -0,0 +1,60 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+from config.settings import settings
+
+def answer_probabilities(top_logprobs: Optional[dict]) -> Optional[Tuple[float, float]]:
+    """Probabilities of the "true" and "false" answers among the top logprobs of one position.
+
+    Tokenizer variants (" true", "True", ...) are summed. An answer missing from
+    the top list gets the probability of the least likely listed token, its
+    upper bound.
+    """
+    if not top_logprobs:
+        return None
+    floor = min(math.exp(logprob.logprob) for logprob in top_logprobs.values())
+    p_true = p_false = 0.0
+    for logprob in top_logprobs.values():
+        token = (logprob.decoded_token or "").strip().lower()
+        if token == "true":
+            p_true += math.exp(logprob.logprob)
+        elif token == "false":
+            p_false += math.exp(logprob.logprob)
+    return (p_true or floor), (p_false or floor)
+
+def calibrated_score(p_true: float, p_false: float) -> float:
+    """Platt-scaled P(true) from the true/false log-odds.
+
+    With PREFILTER_CALIBRATION_SCALE 1 and PREFILTER_CALIBRATION_BIAS 0 this is
+    P(true) renormalized over the two answers.
+    """
+    log_odds = math.log(p_true) - math.log(p_false)
+    z = settings.PREFILTER_CALIBRATION_SCALE * log_odds + settings.PREFILTER_CALIBRATION_BIAS
+    if z >= 0:
+        return 1 / (1 + math.exp(-z))
+    return math.exp(z) / (1 + math.exp(z))
+
+def score_output(output) -> float:
+    """Score of one single-token prefilter completion.
+
+    Engines that return no logprobs (the stub) are scored from the sampled text.
+    """
+    completion = output.outputs[0]
+    probabilities = answer_probabilities(completion.logprobs[0] if completion.logprobs else None)
+    if probabilities is None:
+        return 1.0 if completion.text.strip().lower().startswith("true") else 0.0
+    return calibrated_score(*probabilities)
+
+def select_sections(scores: Sequence[float], threshold: float, top_k: Optional[int] = None) -> List[bool]:
+    """Keep the sections scoring at least `threshold`; with `top_k`, only the k best of those.
+
+    A `top_k` of 0 or None keeps every section above the threshold. Ties are
+    broken by section order.
+    """
+    if top_k is not None and top_k < 0:
+        raise ValueError("top_k must not be negative")
+    keep = [score >= threshold for score in scores]
+    if top_k:
+        ranked = sorted((i for i, kept in enumerate(keep) if kept), key=lambda i: -scores[i])
+        allowed = set(ranked[:top_k])
+        keep = [i in allowed for i in range(len(scores))]
+    return keep
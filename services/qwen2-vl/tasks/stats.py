@@ -0,0 +1,182 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+from prometheus_client import REGISTRY
+from config.settings import settings
+
+SCHEDULER_FIELDS = ("waiting", "running", "swapped", "kv_cache_usage", "prefix_cache_hit_rate")
+
+# Prometheus metrics vLLM publishes in-process for both engine generations;
+# alternatives are listed where a metric was renamed between releases
+VLLM_REQUEST_GAUGES = {
+    "waiting": ("vllm:num_requests_waiting",),
+    "running": ("vllm:num_requests_running",),
+    "swapped": ("vllm:num_requests_swapped",)
+}
+VLLM_KV_CACHE_USAGE = ("vllm:kv_cache_usage_perc", "vllm:gpu_cache_usage_perc")
+# V1 counts prefix-cache hits and queries in tokens; V0 publishes the hit rate itself
+VLLM_PREFIX_CACHE_HITS = "vllm:prefix_cache_hits_total"
+VLLM_PREFIX_CACHE_QUERIES = "vllm:prefix_cache_queries_total"
+VLLM_PREFIX_CACHE_HIT_RATE = "vllm:gpu_prefix_cache_hit_rate"
+
+def vllm_samples(registry=REGISTRY) -> Dict[str, list]:
+    """Values of every vLLM sample in `registry`, by sample name (one per engine/model label set)."""
+    samples = {}
+    for family in registry.collect():
+        if family.name.startswith("vllm:"):
+            for sample in family.samples:
+                samples.setdefault(sample.name, []).append(sample.value)
+    return samples
+
+def vllm_scheduler_state(registry=REGISTRY) -> Optional[dict]:
+    """Waiting/running/swapped requests, KV-cache usage and prefix-cache hit rate
+    from vLLM's Prometheus metrics.
+
+    Request counts are summed over engines and cache usage is averaged. The
+    hit rate covers all prefix-cache lookups since the engine started. Fields
+    the running vLLM version does not publish (e.g. swapped on V1) are None;
+    returns None while vLLM publishes no metrics at all.
+    """
+    samples = vllm_samples(registry)
+    if not samples:
+        return None
+
+    def first(names: tuple) -> Optional[list]:
+        return next((samples[name] for name in names if name in samples), None)
+
+    state = {}
+    for field, names in VLLM_REQUEST_GAUGES.items():
+        values = first(names)
+        state[field] = int(sum(values)) if values is not None else None
+    usage = first(VLLM_KV_CACHE_USAGE)
+    state["kv_cache_usage"] = round(sum(usage) / len(usage), 4) if usage else None
+
+    state["prefix_cache_hit_rate"] = None
+    if VLLM_PREFIX_CACHE_QUERIES in samples:
+        queries = sum(samples[VLLM_PREFIX_CACHE_QUERIES])
+        if queries:
+            state["prefix_cache_hit_rate"] = round(sum(samples.get(VLLM_PREFIX_CACHE_HITS, ())) / queries, 4)
+    elif VLLM_PREFIX_CACHE_HIT_RATE in samples:
+        rates = samples[VLLM_PREFIX_CACHE_HIT_RATE]
+        state["prefix_cache_hit_rate"] = round(sum(rates) / len(rates), 4)
+    return state
+
+class SlidingWindow:
+    """Timestamped values from the last `seconds`."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.samples = deque()
+
+    def add(self, value: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, value))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self.samples and self.samples[0][0] < now - self.seconds:
+            self.samples.popleft()
+
+    def values(self) -> list:
+        self._trim(time.monotonic())
+        return [value for _, value in self.samples]
+
+    def total(self) -> float:
+        return sum(self.values())
+
+    def summary(self) -> dict:
+        values = sorted(self.values())
+        if not values:
+            return {"count": 0}
+        def percentile(q: float) -> float:
+            return round(values[int(round(q * (len(values) - 1)))], 4)
+        return {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 4),
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "max": round(values[-1], 4)
+        }
+
+class EngineStats:
+    """Engine scheduling and request statistics over a sliding window.
+
+    Scheduler state (waiting/running/swapped sequences, KV-cache usage) is
+    sampled every `sample_interval` seconds by `run_sampler`; token counts,
+    lock waits and request latencies are recorded as they happen.
+    """
+
+    def __init__(self, window_seconds: float, sample_interval: float):
+        self.window_seconds = window_seconds
+        self.sample_interval = sample_interval
+        self.started_at = time.monotonic()
+        self.scheduler = {name: SlidingWindow(window_seconds) for name in SCHEDULER_FIELDS}
+        self.prompt_tokens = SlidingWindow(window_seconds)
+        self.generation_tokens = SlidingWindow(window_seconds)
+        self.lock_wait = SlidingWindow(window_seconds)
+        self.routes: Dict[str, SlidingWindow] = {}
+        self.route_errors: Dict[str, SlidingWindow] = {}
+
+    def record_generation(self, outputs: Iterable):
+        prompt_tokens = generation_tokens = 0
+        for output in outputs:
+            prompt_tokens += len(getattr(output, "prompt_token_ids", None) or ())
+            generation_tokens += sum(len(completion.token_ids or ()) for completion in output.outputs)
+        self.prompt_tokens.add(prompt_tokens)
+        self.generation_tokens.add(generation_tokens)
+
+    def record_lock_wait(self, seconds: float):
+        self.lock_wait.add(seconds)
+
+    def record_request(self, route: str, status: int, seconds: float):
+        self.routes.setdefault(route, SlidingWindow(self.window_seconds)).add(seconds)
+        if status >= 500:
+            self.route_errors.setdefault(route, SlidingWindow(self.window_seconds)).add(1)
+
+    def sample(self, state: dict):
+        now = time.monotonic()
+        for name in SCHEDULER_FIELDS:
+            if state.get(name) is not None:
+                self.scheduler[name].add(state[name], now)
+
+    async def run_sampler(self, read_state: Callable[[], Optional[dict]]):
+        while True:
+            try:
+                state = read_state()
+                if state:
+                    self.sample(state)
+            except Exception as e:
+                print(f"Scheduler sampling failed: {e}")
+            await asyncio.sleep(self.sample_interval)
+
+    def _per_second(self, window: SlidingWindow) -> float:
+        elapsed = min(self.window_seconds, time.monotonic() - self.started_at)
+        return round(window.total() / elapsed, 2) if elapsed > 0 else 0.0
+
+    def snapshot(self, current: Optional[dict]) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "scheduler": {
+                "current": current,
+                **{name: self.scheduler[name].summary() for name in SCHEDULER_FIELDS}
+            },
+            "throughput": {
+                "prompt_tokens_per_s": self._per_second(self.prompt_tokens),
+                "generation_tokens_per_s": self._per_second(self.generation_tokens)
+            },
+            "lock_wait_seconds": self.lock_wait.summary(),
+            "routes": {
+                route: {
+                    **latency.summary(),
+                    "errors": len(self.route_errors[route].values()) if route in self.route_errors else 0
+                }
+                for route, latency in self.routes.items()
+            },
+            "limits": {
+                "max_num_seqs": settings.MAX_NUM_SEQS,
+                "max_num_batched_tokens": settings.MAX_NUM_BATCHED_TOKENS
+            }
+        }
+
+engine_stats = EngineStats(settings.STATS_WINDOW_SECONDS, settings.STATS_SAMPLE_INTERVAL)
@@ -0,0 +1,99 @@
+"""Benchmark image preprocessing for a 100-image /analyze batch.
+
+Compares the former per-route path (decode, pad, PNG re-encode, decode again)
+with tasks.image.prepare_images, and measures how long the event loop is
+blocked while each runs.
+
+Usage (from services/qwen2-vl):
+    python test/benchmark_image.py [--images 100] [--workers 4]
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from tasks.image import prepare_images
+
+def synthetic_crops(count: int, seed: int = 0) -> list:
+    """PNG crops of the sizes mask-generation produces: small icons up to wide sections."""
+    rng = random.Random(seed)
+    crops = []
+    for _ in range(count):
+        size = rng.choice([(16, 16), (24, 40), (64, 64), (180, 48), (640, 220), (1280, 400)])
+        image = Image.effect_noise(size, rng.randint(10, 80)).convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        crops.append(buffer.getvalue())
+    return crops
+
+def png_round_trip(image_data: bytes) -> Image.Image:
+    """The preprocessing the routes used to run inline on the event loop."""
+    with Image.open(io.BytesIO(image_data)) as img:
+        img = img.convert("RGB")
+        w, h = img.size
+        if w < 28 or h < 28:
+            padded_img = Image.new('RGB', (max(w, 28), max(h, 28)), 'white')
+            padded_img.paste(img, (0, 0))
+            img = padded_img
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='PNG')
+    with Image.open(io.BytesIO(img_byte_arr.getvalue())) as img:
+        return img.convert("RGB")
+
+async def max_loop_stall(work) -> tuple:
+    """Run `work` while a ticker measures the longest gap between event loop iterations."""
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    result = await work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return result, elapsed, max(stalls, default=elapsed)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    crops = synthetic_crops(args.images)
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    async def inline():
+        return [png_round_trip(data) for data in crops]
+
+    async def shared():
+        return await prepare_images(crops, executor)
+
+    reference, reference_time, reference_stall = await max_loop_stall(inline)
+    prepared, prepared_time, prepared_stall = await max_loop_stall(shared)
+    identical = all(a.tobytes() == b.tobytes() and a.size == b.size for a, b in zip(reference, prepared))
+
+    print(f"{'path':<28} {'total':>9} {'max loop stall':>15}")
+    print(f"{'PNG round trip (inline)':<28} {reference_time:>8.3f}s {reference_stall:>14.3f}s")
+    print(f"{'prepare_images (executor)':<28} {prepared_time:>8.3f}s {prepared_stall:>14.3f}s")
+    print(f"identical pixels: {identical}")
+    executor.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""Benchmark prefill tokens saved by prefix caching.
+
+Builds the prompts of a 100-crop /analyze batch (plus a prefilter and a match
+batch for comparison) and counts, per batch, how many prompt tokens vLLM
+prefills with and without prefix caching. Only full KV blocks of a shared
+prefix are reused, so the cached prefix is rounded down to --block-size.
+
+Image tokens follow the Qwen2-VL vision encoder: one token per 28x28 patch
+after resizing to a multiple of 28, with at least 56x56 pixels.
+
+Text is counted with the model's tokenizer (transformers). --estimate counts
+4 characters per token instead, for machines without the tokenizer; the
+report says which was used.
+
+--measure also runs the /analyze batch through vLLM with prefix caching and
+reports the prompt tokens the engine actually served from the cache
+(RequestOutput.num_cached_tokens). One warm-up request fills the cache
+first, as in a running service. Needs a GPU that fits --model.
+
+Usage (from services/qwen2-vl):
+    python test/benchmark_prefix.py [--crops 100] [--block-size 16] [--tokenizer Qwen/Qwen2-VL-72B-Instruct-AWQ]
+    python test/benchmark_prefix.py --estimate
+    python test/benchmark_prefix.py --measure [--model Qwen/Qwen2-VL-2B-Instruct]
+"""
+import argparse
+import math
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from tasks.prompt import (ANALYSIS_PREFIX, COMPARISON_PREFIX, PREFILTER_PREFIX, create_analysis_prompt,
+                          create_comparison_prompt, create_prefilter_prompt)
+
+SPECIAL_TOKEN = re.compile(r"<\|[a-z_]+\|>")
+CROP_SIZES = [(16, 16), (24, 40), (64, 64), (180, 48), (640, 220), (1280, 400)]
+NORMALIZED_PROMPT = {
+    "type": "button",
+    "primary_function": "initiate calls/communication",
+    "color": "green",
+    "visual_elements": ["phone icon"],
+    "derived_intent": "make a phone call"
+}
+
+def load_counter(name: str, estimate: bool):
+    if estimate:
+        def estimated(text: str) -> int:
+            specials = SPECIAL_TOKEN.findall(text)
+            return len(specials) + math.ceil(len(SPECIAL_TOKEN.sub("", text)) / 4)
+        return estimated, "estimated at 4 characters per token"
+
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(name)
+    except Exception as e:
+        sys.exit(f"Tokenizer {name} unavailable ({type(e).__name__}: {e}); pass --estimate to count characters instead")
+    return (lambda text: len(tokenizer.encode(text, add_special_tokens=False))), f"tokenizer {name}"
+
+def image_tokens(size: tuple) -> int:
+    width, height = (max(56, round(side / 28) * 28) for side in size)
+    return (width // 28) * (height // 28)
+
+def batch_report(name: str, prompts: list, prefix: str, extra_tokens: list, count, block_size: int) -> dict:
+    """Prefill with and without prefix caching for one batch of prompts sharing `prefix`.
+
+    Prompts of a batch may share more than the module prefix (the prefilter and
+    match prompts also share the request's description), so the shared part is
+    the longest common prefix of all prompts, which starts with `prefix`.
+    """
+    assert all(prompt.startswith(prefix) for prompt in prompts), f"{name}: prompt does not start with its prefix"
+    shared = os.path.commonprefix(prompts)
+    # Placeholder tokens expand to image tokens, so sharing stops at the first image.
+    shared = shared.split("<|vision_start|>")[0]
+    shared_tokens = count(shared)
+    cached_tokens = shared_tokens // block_size * block_size
+
+    totals = [count(prompt) + extra for prompt, extra in zip(prompts, extra_tokens)]
+    without_cache = sum(totals)
+    with_cache = without_cache - cached_tokens * (len(prompts) - 1)
+    return {
+        "batch": name,
+        "sequences": len(prompts),
+        "module_prefix_tokens": count(prefix),
+        "shared_prefix_tokens": shared_tokens,
+        "prefill_without_cache": without_cache,
+        "prefill_with_cache": with_cache,
+        "saved": without_cache - with_cache,
+        "saved_fraction": (without_cache - with_cache) / without_cache
+    }
+
+def measure_analysis(model: str, crop_sizes: list, block_size: int) -> dict:
+    """Prefill of one /analyze batch as served by vLLM with prefix caching."""
+    from PIL import Image
+    from vllm import LLM, SamplingParams
+
+    llm = LLM(model=model, trust_remote_code=True, enable_prefix_caching=True, block_size=block_size,
+              limit_mm_per_prompt={"image": 1})
+    prompt = create_analysis_prompt()
+    params = SamplingParams(temperature=0.0, max_tokens=1)
+
+    def crop_input(size: tuple) -> dict:
+        return {"prompt": prompt, "multi_modal_data": {"image": Image.effect_noise(size, 64).convert("RGB")}}
+
+    llm.generate([crop_input(crop_sizes[0])], params)
+    outputs = llm.generate([crop_input(size) for size in crop_sizes], params)
+    prefill = sum(len(output.prompt_token_ids) for output in outputs)
+    cached = sum(getattr(output, "num_cached_tokens", None) or 0 for output in outputs)
+    return {"prefill": prefill, "cached": cached, "cached_fraction": cached / prefill}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crops", type=int, default=100)
+    parser.add_argument("--sections", type=int, default=64)
+    parser.add_argument("--groups", type=int, default=64)
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--tokenizer", default=settings.MODEL_NAME)
+    parser.add_argument("--estimate", action="store_true", help="estimate token counts from the text length")
+    parser.add_argument("--measure", action="store_true", help="also run the /analyze batch through vLLM")
+    parser.add_argument("--model", default=settings.MODEL_NAME, help="model for --measure")
+    args = parser.parse_args()
+
+    count, counter_name = load_counter(args.tokenizer, args.estimate)
+    rng = random.Random(0)
+
+    crop_sizes = [rng.choice(CROP_SIZES) for _ in range(args.crops)]
+    analysis = batch_report(
+        f"/analyze ({args.crops} crops)", [create_analysis_prompt() for _ in crop_sizes], ANALYSIS_PREFIX,
+        [image_tokens(size) for size in crop_sizes], count, args.block_size
+    )
+
+    section_sizes = [(1280, rng.randint(100, 900)) for _ in range(args.sections)]
+    prefilter = batch_report(
+        f"/prefilter ({args.sections} sections)",
+        [create_prefilter_prompt(NORMALIZED_PROMPT) for _ in section_sizes], PREFILTER_PREFIX,
+        [image_tokens(size) for size in section_sizes], count, args.block_size
+    )
+
+    groups = [
+        [{"id": f"elem{g * 5 + i}", "type": "button", "visual_elements": ["phone icon"], "dominant_color": "green",
+          "text": rng.choice(["call", "dial", "settings", None])} for i in range(5)]
+        for g in range(args.groups)
+    ]
+    match = batch_report(
+        f"/match/batch ({args.groups} groups)",
+        [create_comparison_prompt(NORMALIZED_PROMPT, group) for group in groups], COMPARISON_PREFIX,
+        [0] * len(groups), count, args.block_size
+    )
+
+    print(f"Token counts: {counter_name}, KV block size {args.block_size}")
+    print(f"{'batch':<30} {'seqs':>5} {'prefix':>7} {'shared':>7} {'no cache':>10} {'cache':>10} {'saved':>10}")
+    for report in (analysis, prefilter, match):
+        print(f"{report['batch']:<30} {report['sequences']:>5} {report['module_prefix_tokens']:>7} "
+              f"{report['shared_prefix_tokens']:>7} {report['prefill_without_cache']:>10} "
+              f"{report['prefill_with_cache']:>10} {report['saved']:>10} ({report['saved_fraction']:.0%})")
+    print(f"\nPrefill tokens saved per /analyze batch of {args.crops}: {analysis['saved']}")
+
+    if args.measure:
+        measured = measure_analysis(args.model, crop_sizes, args.block_size)
+        print(f"Measured with {args.model}: {measured['cached']} of {measured['prefill']} prompt tokens "
+              f"served from the prefix cache ({measured['cached_fraction']:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""ENGINE_MODE=stub: the service imports without vLLM and concurrent requests share the engine.
+
+Usage (from services/qwen2-vl):
+    python -m pytest test/test_stub_engine.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ["ENGINE_MODE"] = "stub"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.llm import LLMSingleton
+from models.stub import StubAsyncEngine
+from routes.analysis import analyze_crops
+from routes.match import PromptMatchBatch, UIElement, match_elements_batch
+from tasks.json import TRUNCATED_ERROR
+from tasks.sampling import SamplingParams
+
+DELAY = 0.05
+
+def stub_engine(responder=None) -> StubAsyncEngine:
+    llm = LLMSingleton()
+    llm.engine = StubAsyncEngine(responder=responder, delay=DELAY)
+    return llm.engine
+
+def test_concurrent_requests_overlap():
+    engine = stub_engine()
+    llm = LLMSingleton()
+    params = SamplingParams(temperature=0.1, max_tokens=32)
+
+    async def run():
+        return await asyncio.gather(*[llm.process_request([f"prompt {i}"], params) for i in range(8)])
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert [len(outputs) for outputs in results] == [1] * 8
+    assert engine.max_in_flight > 1
+    assert elapsed < 8 * DELAY
+
+def test_route_runs_without_vllm():
+    assert "vllm" not in sys.modules
+    engine = stub_engine(responder=lambda prompt: "elem1")
+    elements = [UIElement(id=f"elem{i}", type="button", visual_elements=["phone icon"], dominant_color="green",
+                          neighbors={})
+                for i in range(2)]
+    request = PromptMatchBatch(
+        normalized_prompt={"type": "button", "primary_function": "call", "derived_intent": "make a phone call"},
+        groups=[elements, elements, elements]
+    )
+
+    result = asyncio.run(match_elements_batch(request))
+
+    assert result == {"match_ids": ["elem1", "elem1", "elem1"]}
+    assert engine.max_in_flight == 3
+
+def test_reset_drains_in_flight_requests():
+    old = stub_engine()
+    llm = LLMSingleton()
+    params = SamplingParams(temperature=0.1, max_tokens=32)
+    in_flight_at_shutdown = []
+    old.shutdown_background_loop = lambda: in_flight_at_shutdown.append(old.in_flight)
+
+    async def run():
+        streaming = asyncio.create_task(llm.process_request(["a", "b"], params))
+        await asyncio.sleep(0)
+        reset = asyncio.create_task(llm.reset())
+        await asyncio.sleep(0)
+        during_reset = asyncio.create_task(llm.process_request(["c"], params))
+        return await asyncio.gather(streaming, reset, during_reset)
+
+    streamed, memory_stats, later = asyncio.run(run())
+
+    assert len(streamed) == 2 and len(later) == 1
+    assert "error" not in memory_stats
+    assert in_flight_at_shutdown == [0]
+    assert old.max_in_flight == 2
+    assert llm.engine is not old
+
+def test_truncated_completion_is_reported():
+    complete = '{"type": "button", "text": null, "visual_elements": [], "primary_function": "call", "dominant_color": null}'
+    stub_engine(responder=lambda prompt: complete if prompt["multi_modal_data"]["image"] == "short" else complete * 10)
+
+    results = asyncio.run(analyze_crops(["short", "long"]))
+
+    assert results[0]["type"] == "button"
+    assert results[1]["error"] == TRUNCATED_ERROR
@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+import os
+
+import redis.asyncio as redis
+
+def blob_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class RedisBlobStore:
+    """Content-addressed screenshot blobs shared with mask-generation and qwen2-vl.
+
+    Keys are the sha256 of the bytes, so the engine and mask-generation agree on
+    the reference for the same upload without coordinating.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "blob:"):
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        # NX keeps an existing copy; the expiry is refreshed either way.
+        if not await self.client.set(self.prefix + key, data, nx=True, ex=self.ttl_seconds):
+            await self.client.expire(self.prefix + key, self.ttl_seconds)
+        return key
+
+    async def close(self):
+        await self.client.aclose()
+
+class FileBlobStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _write(self, key: str, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, key)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, key, data)
+        return key
+
+    async def close(self):
+        pass
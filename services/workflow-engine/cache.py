@@ -0,0 +1,125 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+ANALYSIS_FIELDS = ("type", "text", "visual_elements", "primary_function", "dominant_color")
+
+def hash_crop(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+async def ensure_ttl_index(collection, field: str, ttl_seconds: int):
+    """Create a TTL index on `field`, updating the expiry if the index already exists."""
+    try:
+        await collection.create_index(field, expireAfterSeconds=ttl_seconds)
+    except OperationFailure:
+        await collection.database.command(
+            "collMod", collection.name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": ttl_seconds}
+        )
+
+class AnalysisCache:
+    """Per-element /analyze results keyed by a hash of the crop bytes.
+
+    The analysis only depends on the crop pixels, so identical crops from
+    different screenshots share one entry. Entries expire after `ttl_seconds`.
+    """
+
+    def __init__(self, collection, ttl_seconds: int):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("crop_hash", unique=True)
+        await ensure_ttl_index(self.collection, "created_at", self.ttl_seconds)
+
+    async def get_many(self, crop_hashes: Iterable[str]) -> Dict[str, Dict]:
+        unique_hashes = list(set(crop_hashes))
+        if not unique_hashes:
+            return {}
+        found = {}
+        async for doc in self.collection.find({"crop_hash": {"$in": unique_hashes}}):
+            found[doc["crop_hash"]] = doc["analysis"]
+        self.hits += len(found)
+        self.misses += len(unique_hashes) - len(found)
+        return found
+
+    async def put_many(self, results: Dict[str, Dict]):
+        operations: List[UpdateOne] = []
+        now = datetime.utcnow()
+        for crop_hash, result in results.items():
+            if not isinstance(result, dict) or "error" in result:
+                continue
+            analysis = {field: result.get(field) for field in ANALYSIS_FIELDS}
+            operations.append(UpdateOne(
+                {"crop_hash": crop_hash},
+                {"$setOnInsert": {"crop_hash": crop_hash, "analysis": analysis, "created_at": now}},
+                upsert=True
+            ))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+class NormalizationCache:
+    """Two-tier cache for /normalize results: an in-process LRU in front of a Mongo collection.
+
+    Entries are keyed by the raw prompt text and the normalization template
+    version reported by qwen2-vl, so a template change never serves stale output.
+    """
+
+    def __init__(self, collection, max_entries: int, ttl_seconds: int):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lru_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("prompt", 1), ("template_version", 1)], unique=True)
+        await ensure_ttl_index(self.collection, "created_at", self.ttl_seconds)
+
+    def _remember(self, key, normalized: Dict):
+        self.entries[key] = normalized
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, prompt: str, template_version: str) -> Optional[Dict]:
+        key = (template_version, prompt)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.lru_hits += 1
+            return self.entries[key]
+
+        doc = await self.collection.find_one({"prompt": prompt, "template_version": template_version})
+        if doc is None:
+            self.misses += 1
+            return None
+        self.mongo_hits += 1
+        self._remember(key, doc["normalized"])
+        return doc["normalized"]
+
+    async def put(self, prompt: str, template_version: str, normalized: Dict):
+        self._remember((template_version, prompt), normalized)
+        await self.collection.update_one(
+            {"prompt": prompt, "template_version": template_version},
+            {"$setOnInsert": {"normalized": normalized, "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "lru_hits": self.lru_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "size": len(self.entries)
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from cache import ensure_ttl_index
+
+class JobQueueFull(Exception):
+    pass
+
+class JobStore:
+    """Job records in MongoDB: status, per-stage progress and the final result.
+
+    Records expire `ttl_seconds` after the job was submitted.
+    """
+
+    def __init__(self, collection, ttl_seconds: int):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def ensure_indexes(self):
+        await ensure_ttl_index(self.collection, "created_at", self.ttl_seconds)
+
+    async def create(self, job_id: str, prompt: str, image_hash: str):
+        await self.collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "prompt": prompt,
+            "image_hash": image_hash,
+            "stages": {},
+            "created_at": datetime.utcnow()
+        })
+
+    async def update(self, job_id: str, **fields):
+        await self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    async def update_stage(self, job_id: str, stage: str, state: str, timing: Optional[Dict[str, float]]):
+        entry = {"status": state}
+        if timing and state != "running":
+            entry.update(timing)
+        await self.collection.update_one({"_id": job_id}, {"$set": {f"stages.{stage}": entry}})
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        record = await self.collection.find_one({"_id": job_id})
+        if record is None:
+            return None
+        job = {"job_id": record.pop("_id")}
+        job.update(record)
+        for field in ("created_at", "started_at", "finished_at"):
+            if job.get(field):
+                job[field] = job[field].isoformat()
+        return job
+
+class JobRunner:
+    """Runs submitted pipeline jobs in the background.
+
+    At most `max_concurrent` jobs run at once; the rest wait in submission
+    order. Submissions beyond `max_pending` unfinished jobs raise JobQueueFull,
+    since every waiting job keeps its upload in memory. `pipeline` is called
+    with the job's arguments plus a `listener` for stage progress.
+    """
+
+    def __init__(self, store: JobStore, pipeline: Callable[..., Awaitable[Dict]], max_concurrent: int,
+        max_pending: int):
+        self.store = store
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, prompt: str, image_hash: str, **kwargs) -> str:
+        if len(self.tasks) >= self.max_pending:
+            raise JobQueueFull(f"{len(self.tasks)} jobs pending")
+        job_id = uuid.uuid4().hex
+        await self.store.create(job_id, prompt, image_hash)
+        task = asyncio.create_task(self._run(job_id, prompt=prompt, **kwargs))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job_id
+
+    def _listener(self, job_id: str):
+        async def on_stage(stage: str, state: str, timing: Optional[Dict[str, float]]):
+            try:
+                await self.store.update_stage(job_id, stage, state, timing)
+            except Exception as e:
+                # Progress is informational; a failed write must not fail the job.
+                print(f"Failed to record stage {stage} of job {job_id}: {e}")
+        return on_stage
+
+    async def _run(self, job_id: str, **kwargs):
+        try:
+            async with self.semaphore:
+                await self.store.update(job_id, status="running", started_at=datetime.utcnow())
+                result = await self.pipeline(listener=self._listener(job_id), **kwargs)
+                await self.store.update(job_id, status="done", result=result, finished_at=datetime.utcnow())
+        except asyncio.CancelledError:
+            await self.store.update(job_id, status="failed", error="Job cancelled", finished_at=datetime.utcnow())
+            raise
+        except Exception as e:
+            print(f"Job {job_id} failed: {type(e).__name__}: {e}")
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            await self.store.update(job_id, status="failed", error=error, finished_at=datetime.utcnow())
+
+    async def close(self):
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
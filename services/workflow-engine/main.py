@@ -5,19 +5,100 @@ import hashlib
 from io import BytesIO
 from datetime import datetime
 import base64
-from typing import Dict, List
+import copy
+import json
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import asyncio
+import os
+import time
+from cache import AnalysisCache, NormalizationCache, hash_crop
+from upstream import UpstreamPool
+from pipeline import StageGraph, StageListener
+from jobs import JobQueueFull, JobRunner, JobStore
+from telemetry import TraceMiddleware, metrics_response, span
+from blobstore import FileBlobStore, RedisBlobStore
+
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+NORMALIZATION_CACHE_SIZE = int(os.getenv("NORMALIZATION_CACHE_SIZE", "1024"))
+NORMALIZATION_CACHE_TTL = int(os.getenv("NORMALIZATION_CACHE_TTL", str(30 * 24 * 3600)))
+NORMALIZATION_VERSION_REFRESH = float(os.getenv("NORMALIZATION_VERSION_REFRESH", "300"))
+MASK_MAX_CONNECTIONS = int(os.getenv("MASK_MAX_CONNECTIONS", "4"))
+QWEN_MAX_CONNECTIONS = int(os.getenv("QWEN_MAX_CONNECTIONS", "16"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "600"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_KEEPALIVE = float(os.getenv("UPSTREAM_KEEPALIVE", "60"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+# "inline": base64 PNG crops in every payload, "ref": boxes plus a reference into the shared blob store,
+# "upload": boxes only, with the screenshot uploaded to qwen2-vl alongside each prefilter/analysis batch
+CROP_TRANSPORT = os.getenv("CROP_TRANSPORT", "inline")
+MASK_IMAGE_MODE = {"inline": "inline", "ref": "ref", "upload": "none"}[CROP_TRANSPORT]
+BLOB_STORE = os.getenv("BLOB_STORE", "redis")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/tmp/blobs")
+BLOB_TTL = int(os.getenv("BLOB_TTL", "3600"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "64"))
 
-app = FastAPI()
 mongo_client = AsyncIOMotorClient("mongodb://mongo:27017")
 db = mongo_client.cache_db
 cache_collection = db.image_cache
+analysis_cache = AnalysisCache(db.analysis_cache, ANALYSIS_CACHE_TTL)
+normalization_cache = NormalizationCache(db.normalization_cache, NORMALIZATION_CACHE_SIZE, NORMALIZATION_CACHE_TTL)
+normalization_version = {"value": None, "fetched_at": 0.0}
+upstream = UpstreamPool(
+    limits={"mask-generation": MASK_MAX_CONNECTIONS, "qwen2-vl": QWEN_MAX_CONNECTIONS},
+    timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT, sock_connect=UPSTREAM_CONNECT_TIMEOUT),
+    keepalive_timeout=UPSTREAM_KEEPALIVE,
+    retries=UPSTREAM_RETRIES
+)
+blob_store = FileBlobStore(BLOB_STORE_DIR) if BLOB_STORE == "file" else RedisBlobStore(REDIS_URL, BLOB_TTL)
+# Screenshot of the request being processed, for the "upload" crop transport
+current_screenshot: ContextVar[Optional[bytes]] = ContextVar("current_screenshot", default=None)
+job_store = JobStore(db.jobs, JOB_TTL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.start()
+    await analysis_cache.ensure_indexes()
+    await normalization_cache.ensure_indexes()
+    await job_store.ensure_indexes()
+    try:
+        yield
+    finally:
+        await job_runner.close()
+        await upstream.close()
+        await blob_store.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TraceMiddleware)
 
 MASK_API_URL = "http://mask-generation:8000/api/artifacts"
+MASK_API_STREAM_URL = "http://mask-generation:8000/api/artifacts/stream"
 QWEN_API_NORMALIZE_URL = "http://qwen2-vl:8000/api/v1/normalize" 
+QWEN_API_NORMALIZE_VERSION_URL = "http://qwen2-vl:8000/api/v1/normalize/version"
 QWEN_API_FILTER_URL = "http://qwen2-vl:8000/api/v1/prefilter"
 QWEN_API_ANALYZE_URL = "http://qwen2-vl:8000/api/v1/analyze"
-QWEN_API_MATCH_URL = "http://qwen2-vl:8000/api/v1/match"
+QWEN_API_ANALYZE_REGIONS_URL = "http://qwen2-vl:8000/api/v1/analyze/regions"
+QWEN_API_FILTER_REGIONS_URL = "http://qwen2-vl:8000/api/v1/prefilter/regions"
+QWEN_API_ANALYZE_CROPS_URL = "http://qwen2-vl:8000/api/v1/analyze/crops"
+QWEN_API_FILTER_CROPS_URL = "http://qwen2-vl:8000/api/v1/prefilter/crops"
+QWEN_API_MATCH_BATCH_URL = "http://qwen2-vl:8000/api/v1/match/batch"
+
+MASK_STREAMING = os.getenv("MASK_STREAMING", "true").lower() == "true"
+PREFILTER_BATCH_SIZE = int(os.getenv("PREFILTER_BATCH_SIZE", "64"))
+PREFILTER_CONCURRENCY = int(os.getenv("PREFILTER_CONCURRENCY", "2"))
+# "generate": qwen2-vl samples a JSON yes/no, "score": it returns a calibrated P(contains) from one forward pass
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "generate")
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.5"))
+PREFILTER_RELAXED_THRESHOLD = float(os.getenv("PREFILTER_RELAXED_THRESHOLD", "0.2"))
+# Keep only the best-scoring sections across the whole screenshot (0: keep all above the threshold)
+PREFILTER_TOP_K = int(os.getenv("PREFILTER_TOP_K", "0"))
+MATCH_FAN_IN = int(os.getenv("MATCH_FAN_IN", "5"))
+MATCH_CONCURRENCY = int(os.getenv("MATCH_CONCURRENCY", "8"))
+MATCH_BATCH_GROUPS = int(os.getenv("MATCH_BATCH_GROUPS", "64"))
 
 def prepare_element_for_match(element: Dict) -> Dict:
     clean_element = {
@@ -46,75 +127,68 @@ def prepare_element_for_match(element: Dict) -> Dict:
             clean_element["neighbors"] = clean_neighbors
     return clean_element
 
-async def do_initial_matches(children: List[Dict], normalized_prompt: str) -> List[Dict]:
-    cleaned_children = [prepare_element_for_match(child) for child in children]
-    batches = []
-    for i in range(0, len(cleaned_children), 5):
-        batch = cleaned_children[i:i + 5]
-        batches.append(batch)
-    
-    matches = []
-    async with aiohttp.ClientSession() as session:
-        for batch in batches:
-            data = {
-                "normalized_prompt": normalized_prompt,
-                "elements": batch
-            }
-            try:
-                async with session.post(QWEN_API_MATCH_URL, json=data) as response:
-                    if response.status != 200:
-                        continue
-                    result = await response.json()
-                    if result.get("match_id"):
-                        matched_element = next(
-                            (elem for elem in children if elem["id"] == result["match_id"]),
-                            None
-                        )
-                        if matched_element:
-                            matches.append(matched_element)
-            except Exception:
-                continue
-    print(f"DEBUG - Initial matches found: {len(matches)}")
-    return matches
-
-async def reduce_matches(matches: List[Dict], normalized_prompt: str) -> Dict:
-    current_matches = matches
+async def match_groups(groups: List[List[Dict]], normalized_prompt: str) -> List[Optional[Dict]]:
+    data = {
+        "normalized_prompt": normalized_prompt,
+        "groups": [[prepare_element_for_match(element) for element in group] for group in groups]
+    }
+    try:
+        async with upstream.post(QWEN_API_MATCH_BATCH_URL, json=data) as response:
+            if response.status != 200:
+                return [None] * len(groups)
+            result = await response.json()
+    except Exception:
+        return [None] * len(groups)
+
+    winners = []
+    for group, match_id in zip(groups, result.get("match_ids") or []):
+        winners.append(next((elem for elem in group if match_id and elem["id"] == match_id), None))
+    return winners
+
+async def run_match_round(candidates: List[Dict], normalized_prompt: str, semaphore: asyncio.Semaphore) -> List[Dict]:
+    groups = [candidates[i:i + MATCH_FAN_IN] for i in range(0, len(candidates), MATCH_FAN_IN)]
+    chunks = [groups[i:i + MATCH_BATCH_GROUPS] for i in range(0, len(groups), MATCH_BATCH_GROUPS)]
+
+    async def run_chunk(chunk: List[List[Dict]]) -> List[Optional[Dict]]:
+        async with semaphore:
+            return await match_groups(chunk, normalized_prompt)
+
+    results = await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+    return [winner for winners in results for winner in winners if winner]
+
+async def tournament_match(children: List[Dict], normalized_prompt: str) -> Tuple[Optional[Dict], List[Dict]]:
+    """Reduce children to a single match, dispatching every batch of a round concurrently.
+
+    Returns the winning element (or None) and per-round timings.
+    """
+    rounds = []
+    semaphore = asyncio.Semaphore(MATCH_CONCURRENCY)
+
+    async def play_round(candidates: List[Dict]) -> List[Dict]:
+        start = time.perf_counter()
+        with span("match_round"):
+            winners = await run_match_round(candidates, normalized_prompt, semaphore)
+        rounds.append({
+            "round": len(rounds) + 1,
+            "candidates": len(candidates),
+            "batches": -(-len(candidates) // MATCH_FAN_IN),
+            "winners": len(winners),
+            "duration": round(time.perf_counter() - start, 3)
+        })
+        print(f"DEBUG - Round {len(rounds)}: {len(candidates)} -> {len(winners)} matches")
+        return winners
+
+    if not children:
+        return None, rounds
+
+    current_matches = await play_round(children)
     while len(current_matches) > 1:
-        batches = []
-        for i in range(0, len(current_matches), 5):
-            batch = current_matches[i:i + 5]
-            batches.append(batch)
-        
-        new_matches = []
-        async with aiohttp.ClientSession() as session:
-            for batch in batches:
-                cleaned_batch = [prepare_element_for_match(match) for match in batch]
-                data = {
-                    "normalized_prompt": normalized_prompt,
-                    "elements": cleaned_batch
-                }
-                try:
-                    async with session.post(QWEN_API_MATCH_URL, json=data) as response:
-                        if response.status != 200:
-                            continue
-                        result = await response.json()
-                        if result.get("match_id"):
-                            matched_element = next(
-                                (elem for elem in batch if elem["id"] == result["match_id"]),
-                                None
-                            )
-                            if matched_element:
-                                new_matches.append(matched_element)
-                except Exception:
-                    continue
-        
+        new_matches = await play_round(current_matches)
         if not new_matches:
             break
-            
-        print(f"DEBUG - Reduced to {len(new_matches)} matches")  # <-- HIER das print einfügen
         current_matches = new_matches
-    
-    return current_matches[0] if current_matches else None
+
+    return (current_matches[0] if current_matches else None), rounds
 
 async def collect_children_for_matching(filtered_sections: List[Dict]):
     all_children = []
@@ -196,118 +270,200 @@ def build_section_map(sections: List[Dict]) -> Dict:
         section_map[section["id"]] = section
         if section.get("has_children") and section.get("children"):
             for child in section["children"]:
-                add_section_recursive(child)
+                # Element children are id references to elements already in the section.
+                if isinstance(child, dict):
+                    add_section_recursive(child)
     for section in sections:
         add_section_recursive(section)
     return section_map
 
+def apply_analysis(section: Dict, result: Dict):
+    section.update({
+        "type": result.get("type"),
+        "text": result.get("text"), 
+        "visual_elements": result.get("visual_elements"),
+        "primary_function": result.get("primary_function"),
+        "dominant_color": result.get("dominant_color")
+    })
+    section.pop("score", None)
+    section.pop("label", None)
+    
+    if section.get("children"):
+        for child in section["children"]:
+            if isinstance(child, dict):
+                child.pop("score", None)
+                child.pop("label", None)
+                child.pop("has_children", None)
+                child.pop("children_count", None)
+                child.pop("children", None)
+
+def screenshot_form(**fields: str) -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    form.add_field('image', current_screenshot.get(), filename='screenshot', content_type='application/octet-stream')
+    for name, value in fields.items():
+        form.add_field(name, value)
+    return form
+
+def analysis_request(payloads: List):
+    """POST one /analyze batch in the crop transport its payloads use."""
+    if isinstance(payloads[0], bytes):
+        def build_form() -> aiohttp.FormData:
+            data = aiohttp.FormData()
+            for j, image_bytes in enumerate(payloads):
+                data.add_field('images', image_bytes, filename=f'image{j}.jpg', content_type='image/jpeg')
+            return data
+        return upstream.post(QWEN_API_ANALYZE_URL, data_factory=build_form)
+    if "image_ref" in payloads[0]:
+        return upstream.post(QWEN_API_ANALYZE_REGIONS_URL, json={"regions": payloads})
+    boxes = json.dumps([payload["box"] for payload in payloads])
+    return upstream.post(QWEN_API_ANALYZE_CROPS_URL, data_factory=lambda: screenshot_form(boxes=boxes))
+
 async def analyze_sections(sections: List[Dict]) -> List[Dict]:
     if not sections:
         return []
     
-    analyzed_sections = []
+    # Payloads are PNG bytes for inline crops, or a region ({box} plus image_ref with the blob
+    # store) that qwen2-vl crops itself; mask-generation supplies the crop_hash for regions.
+    pending = []
+    for section in sections:
+        if "image" in section:
+            image_bytes = base64.b64decode(section["image"])
+            pending.append((section, hash_crop(image_bytes), image_bytes))
+        elif "crop_hash" in section:
+            region = {"box": section["box"]}
+            if "image_ref" in section:
+                region["image_ref"] = section["image_ref"]
+            pending.append((section, section["crop_hash"], region))
+
+    cached = await analysis_cache.get_many(crop_hash for _, crop_hash, _ in pending)
+    to_send = {}
+    cached_count = 0
+    for section, crop_hash, payload in pending:
+        if crop_hash in cached:
+            apply_analysis(section, cached[crop_hash])
+            cached_count += 1
+        else:
+            to_send.setdefault(crop_hash, payload)
+
     batch_size = 100
-    total_batches = len(sections) // batch_size + (1 if len(sections) % batch_size else 0)
+    crop_hashes = list(to_send)
+    total_batches = len(crop_hashes) // batch_size + (1 if len(crop_hashes) % batch_size else 0)
+    fresh_results = {}
     
-    print(f"Starting analysis of {len(sections)} sections in {total_batches} batches")
+    print(f"Starting analysis of {len(sections)} sections: {cached_count} cached, "
+          f"{len(crop_hashes)} unique crops in {total_batches} batches")
     
-    async with aiohttp.ClientSession() as session:
-        for i in range(0, len(sections), batch_size):
-            current_batch = sections[i:i + batch_size]
-            batch_number = i // batch_size + 1
-            
-            print(f"Processing batch {batch_number}/{total_batches} with {len(current_batch)} sections")
-            
-            try:
-                data = aiohttp.FormData()
-                image_count = 0
-                total_image_size = 0
-                
-                for j, section in enumerate(current_batch):
-                    if "image" in section:
-                        image_bytes = base64.b64decode(section["image"])
-                        total_image_size += len(image_bytes)
-                        image_count += 1
-                        data.add_field('images', image_bytes, filename=f'image{j}.jpg', content_type='image/jpeg')
-
-                print(f"Batch {batch_number}: Sending {image_count} images, total size: {total_image_size/1024/1024:.2f}MB")
+    for i in range(0, len(crop_hashes), batch_size):
+        current_batch = crop_hashes[i:i + batch_size]
+        batch_number = i // batch_size + 1
+        
+        try:
+            payloads = [to_send[crop_hash] for crop_hash in current_batch]
+            if isinstance(payloads[0], dict):
+                print(f"Batch {batch_number}: Sending {len(current_batch)} regions")
+            else:
+                total_image_size = sum(len(payload) for payload in payloads)
+                print(f"Batch {batch_number}: Sending {len(current_batch)} images, total size: {total_image_size/1024/1024:.2f}MB")
 
-                async with session.post(QWEN_API_ANALYZE_URL, data=data) as response:
+            with span("analyze_batch"):
+                async with analysis_request(payloads) as response:
                     if response.status != 200:
                         error_body = await response.text()
                         print(f"Error in batch {batch_number}: Status {response.status}")
                         print(f"Error body: {error_body}")
                         raise HTTPException(500, f"Analysis failed: {error_body}")
                     
-                    print(f"Batch {batch_number}: Got response, parsing results")
                     results = await response.json()
-                    if not isinstance(results, list):
-                        results = [results]
-                    
-                    print(f"Batch {batch_number}: Processing {len(results)} results")
-                    
-                    for section, result in zip(current_batch, results):
-                        section.update({
-                            "type": result.get("type"),
-                            "text": result.get("text"), 
-                            "visual_elements": result.get("visual_elements"),
-                            "primary_function": result.get("primary_function"),
-                            "dominant_color": result.get("dominant_color")
-                        })
-                        section.pop("score", None)
-                        section.pop("label", None)
-                        
-                        if section.get("children"):
-                            for child in section["children"]:
-                                if isinstance(child, dict):
-                                    child.pop("score", None)
-                                    child.pop("label", None)
-                                    child.pop("has_children", None)
-                                    child.pop("children_count", None)
-                                    child.pop("children", None)
-                    
-                    analyzed_sections.extend(current_batch)
-                    print(f"Batch {batch_number}: Completed successfully")
-                    
-            except Exception as e:
-                print(f"Critical error in batch {batch_number}:")
-                print(f"Error type: {type(e).__name__}")
-                print(f"Error message: {str(e)}")
-                print(f"Current batch size: {len(current_batch)}")
-                print(f"Total analyzed so far: {len(analyzed_sections)}")
-                raise  # Re-raise the exception after logging
-            
-            await asyncio.sleep(0.1)
+                if not isinstance(results, list):
+                    results = [results]
+                
+                for crop_hash, result in zip(current_batch, results):
+                    fresh_results[crop_hash] = result
+                
+        except Exception as e:
+            print(f"Critical error in batch {batch_number}:")
+            print(f"Error type: {type(e).__name__}")
+            print(f"Error message: {str(e)}")
+            print(f"Current batch size: {len(current_batch)}")
+            print(f"Total analyzed so far: {len(fresh_results)}")
+            raise  # Re-raise the exception after logging
+        
+        await asyncio.sleep(0.1)
+
+    await analysis_cache.put_many(fresh_results)
+    for section, crop_hash, _ in pending:
+        if crop_hash in fresh_results:
+            apply_analysis(section, fresh_results[crop_hash])
     
-    print(f"Analysis completed. Processed {len(analyzed_sections)} sections in total")
-    return analyzed_sections
+    print(f"Analysis completed. Processed {len(sections)} sections in total")
+    return list(sections)
 
-async def process_sections(mask_result: Dict, normalized_prompt: str):
-    section_map = build_section_map(mask_result["sections"])
-    filtered_sections = []
-    retry_count = 0
-    max_retries = 1
-
-    async with aiohttp.ClientSession() as session:
-        while not filtered_sections and retry_count <= max_retries:
-            for section in mask_result["sections"]:
-                data = {
-                    "normalized_prompt": normalized_prompt,
-                    "sections": [{
-                        "position_metadata": section["position_metadata"],
-                        "image": section["image"]
-                    }],
-                    "relaxed": retry_count > 0
-                }
-                async with session.post(QWEN_API_FILTER_URL, json=data) as response:
-                    if response.status != 200:
-                        continue
-                    result = await response.json()
-                    if result["results"][0]["likely_contains"]:
-                        filtered_sections.append(section)
-            
-            retry_count += 1
+def prefilter_payload(section: Dict) -> Dict:
+    if "image" in section:
+        return {"position_metadata": section["position_metadata"], "image": section["image"]}
+    payload = {"position_metadata": section["position_metadata"], "box": section["box"]}
+    if "image_ref" in section:
+        payload["image_ref"] = section["image_ref"]
+    return payload
+
+def prefilter_request(data: Dict, first_section: Dict):
+    if "image" in first_section:
+        return upstream.post(QWEN_API_FILTER_URL, json=data)
+    if "image_ref" in first_section:
+        return upstream.post(QWEN_API_FILTER_REGIONS_URL, json=data)
+    request = json.dumps(data)
+    return upstream.post(QWEN_API_FILTER_CROPS_URL, data_factory=lambda: screenshot_form(request=request))
+
+async def prefilter_batch(sections: List[Dict], normalized_prompt: Dict, relaxed: bool) -> List[bool]:
+    data = {
+        "normalized_prompt": normalized_prompt,
+        "sections": [prefilter_payload(section) for section in sections],
+        "relaxed": relaxed,
+        "mode": PREFILTER_MODE,
+        "threshold": PREFILTER_RELAXED_THRESHOLD if relaxed else PREFILTER_THRESHOLD
+    }
+    flags = [False] * len(sections)
+    async with prefilter_request(data, sections[0]) as response:
+        if response.status != 200:
+            return flags
+        result = await response.json()
+    for entry in result["results"]:
+        flags[entry["section_index"]] = bool(entry["likely_contains"])
+        if "score" in entry:
+            sections[entry["section_index"]]["prefilter_score"] = entry["score"]
+    return flags
+
+async def prefilter_pass(sections: List[Dict], normalized_prompt: Dict, relaxed: bool,
+                         semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict]:
+    """Sections the prefilter keeps, in input order.
+
+    Passes of one request that may overlap share `semaphore`, so together they
+    stay within PREFILTER_CONCURRENCY.
+    """
+    batches = [sections[i:i + PREFILTER_BATCH_SIZE] for i in range(0, len(sections), PREFILTER_BATCH_SIZE)]
+    semaphore = semaphore or asyncio.Semaphore(PREFILTER_CONCURRENCY)
+
+    async def run_batch(batch: List[Dict]) -> List[bool]:
+        async with semaphore:
+            with span("prefilter_batch"):
+                return await prefilter_batch(batch, normalized_prompt, relaxed)
+
+    with span("prefilter_relaxed" if relaxed else "prefilter"):
+        batch_flags = await asyncio.gather(*[run_batch(batch) for batch in batches])
+    return [
+        section
+        for batch, flags in zip(batches, batch_flags)
+        for section, keep in zip(batch, flags)
+        if keep
+    ]
+
+def top_sections(sections: List[Dict], k: int) -> List[Dict]:
+    """The k best-scoring sections, best first (all of them, in order, when k is 0 or below)."""
+    if k <= 0:
+        return sections
+    return sorted(sections, key=lambda section: -section.get("prefilter_score", 0.0))[:k]
 
+def collect_sections_to_analyze(filtered_sections: List[Dict], section_map: Dict) -> List[Dict]:
     sections_to_analyze = []
     for section in filtered_sections:
         sections_to_analyze.append(section)
@@ -320,63 +476,269 @@ async def process_sections(mask_result: Dict, normalized_prompt: str):
                             neighbor_id = child["neighbors"][direction]
                             if neighbor_id in section_map:
                                 sections_to_analyze.append(section_map[neighbor_id])
+    return sections_to_analyze
 
-    analyzed_sections = await analyze_sections(sections_to_analyze)
-
-    for section in analyzed_sections:
-        section_map[section["id"]] = section
+async def analyze_filtered_sections(mask_result: Dict, filtered_sections: List[Dict], already_analyzed=frozenset()):
+    section_map = build_section_map(mask_result["sections"])
+    sections_to_analyze = collect_sections_to_analyze(filtered_sections, section_map)
+    await analyze_sections([section for section in sections_to_analyze if section["id"] not in already_analyzed])
 
     resolve_children_neighbors(mask_result, section_map)
 
     return {
         "filtered_section_ids": [section["id"] for section in filtered_sections],
-        "analyzed_section_ids": [section["id"] for section in analyzed_sections]
+        "analyzed_section_ids": [section["id"] for section in sections_to_analyze]
     }
 
-@app.post("/process-image")
-async def process_image(file: UploadFile = File(...), prompt: str = Form(...),
-    include_mask: bool = Query(False), debug: bool = Query(False)):
-    
-    content = await file.read()
+async def process_sections(mask_result: Dict, normalized_prompt: str):
+    filtered_sections = []
+
+    # Strict pass first; the relaxed pass is only dispatched when nothing matched.
+    for relaxed in (False, True):
+        filtered_sections = await prefilter_pass(mask_result["sections"], normalized_prompt, relaxed)
+        if filtered_sections:
+            break
+    filtered_sections = top_sections(filtered_sections, PREFILTER_TOP_K)
+
+    return await analyze_filtered_sections(mask_result, filtered_sections)
+
+async def iter_ndjson(response: aiohttp.ClientResponse) -> AsyncIterator[Dict]:
+    # StreamReader.readline rejects lines above 128KB, and section lines carry base64 crops.
+    buffer = bytearray()
+    async for chunk in response.content.iter_any():
+        search_from = len(buffer)
+        buffer.extend(chunk)
+        line_start = 0
+        newline = buffer.find(b"\n", search_from)
+        while newline != -1:
+            line = bytes(buffer[line_start:newline]).strip()
+            if line:
+                yield json.loads(line)
+            line_start = newline + 1
+            newline = buffer.find(b"\n", line_start)
+        del buffer[:line_start]
+    if bytes(buffer).strip():
+        yield json.loads(bytes(buffer))
+
+async def stream_mask_events(content: bytes, filename: str, content_type: str) -> AsyncIterator[Dict]:
+    def build_form() -> aiohttp.FormData:
+        form = aiohttp.FormData()
+        form.add_field('file', BytesIO(content), filename=filename, content_type=content_type)
+        return form
+
+    async with upstream.post(MASK_API_STREAM_URL, data_factory=build_form, params={"images": MASK_IMAGE_MODE}) as response:
+        if response.status != 200:
+            raise HTTPException(500, "Mask generation failed")
+        async for event in iter_ndjson(response):
+            yield event
+
+async def process_section_stream(events: AsyncIterator[Dict], normalized_prompt: Awaitable) -> Tuple[Dict, Dict, Dict]:
+    """Prefilter and analyze sections while mask-generation is still streaming them.
+
+    Sections that arrive together are prefiltered as one batch, and kept sections
+    are analyzed right away, unless PREFILTER_TOP_K is set: then only the k best
+    are analyzed, after the stream has ended. Neighbor elements are analyzed once the stream has
+    delivered the neighbor map. `normalized_prompt` is awaited only when the first
+    batch is ready, so the stream can start before normalization finishes.
+    Returns the processed mask result, an untouched copy for the mask cache, and
+    the same ids as process_sections.
+    """
+    sections = []
+    raw_sections = []
+    neighbors = {}
+    analyzed_ids = set()
+    queue = asyncio.Queue()
+    # One limit for all batches of the stream, which are prefiltered concurrently
+    prefilter_semaphore = asyncio.Semaphore(PREFILTER_CONCURRENCY)
+
+    async def consume_stream():
+        received_neighbors = False
+        try:
+            with span("mask_stream"):
+                async for event in events:
+                    if event["event"] == "section":
+                        raw_sections.append(copy.deepcopy(event["section"]))
+                        sections.append(event["section"])
+                        queue.put_nowait(event["section"])
+                    elif event["event"] == "neighbors":
+                        neighbors.update(event["neighbors"])
+                        received_neighbors = True
+                    elif event["event"] == "error":
+                        raise HTTPException(500, f"Mask generation failed: {event['error']}")
+                if not received_neighbors:
+                    raise HTTPException(500, "Mask generation stream ended early")
+        finally:
+            queue.put_nowait(None)
+
+    async def prefilter_and_analyze(batch: List[Dict]) -> List[Dict]:
+        kept = await prefilter_pass(batch, await normalized_prompt, relaxed=False, semaphore=prefilter_semaphore)
+        # The top-k cut needs every score, so with PREFILTER_TOP_K analysis waits for the whole stream
+        if kept and PREFILTER_TOP_K <= 0:
+            sections_to_analyze = collect_sections_to_analyze(kept, {})
+            await analyze_sections(sections_to_analyze)
+            analyzed_ids.update(section["id"] for section in sections_to_analyze)
+        return kept
+
+    stream_task = asyncio.create_task(consume_stream())
+    batch_tasks = []
+    finished = False
+    try:
+        while not finished:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < PREFILTER_BATCH_SIZE:
+                batch.append(queue.get_nowait())
+            finished = batch[-1] is None
+            batch = [section for section in batch if section is not None]
+            if batch:
+                batch_tasks.append(asyncio.create_task(prefilter_and_analyze(batch)))
+        await stream_task
+        kept_batches = await asyncio.gather(*batch_tasks)
+    except BaseException:
+        stream_task.cancel()
+        for task in batch_tasks:
+            task.cancel()
+        raise
+
+    for section in sections + raw_sections:
+        for element in section.get("children", []):
+            element["neighbors"] = dict(neighbors.get(element["id"], {}))
+
+    mask_result = {"sections": sections}
+    filtered_sections = [section for kept in kept_batches for section in kept]
+    if not filtered_sections:
+        filtered_sections = await prefilter_pass(sections, await normalized_prompt, relaxed=True,
+                                                 semaphore=prefilter_semaphore)
+    filtered_sections = top_sections(filtered_sections, PREFILTER_TOP_K)
+
+    process_result = await analyze_filtered_sections(mask_result, filtered_sections, analyzed_ids)
+    return mask_result, {"sections": raw_sections}, process_result
+
+async def get_normalization_version() -> Optional[str]:
+    now = time.monotonic()
+    if normalization_version["value"] and now - normalization_version["fetched_at"] < NORMALIZATION_VERSION_REFRESH:
+        return normalization_version["value"]
+    try:
+        async with upstream.get(QWEN_API_NORMALIZE_VERSION_URL) as response:
+            if response.status == 200:
+                normalization_version["value"] = (await response.json())["version"]
+                normalization_version["fetched_at"] = now
+    except Exception:
+        pass
+    return normalization_version["value"]
+
+async def normalize_prompt(prompt: str) -> Dict:
+    template_version = await get_normalization_version()
+    if template_version:
+        cached = await normalization_cache.get(prompt, template_version)
+        if cached is not None:
+            return cached
+
+    async with upstream.post(QWEN_API_NORMALIZE_URL, json={"prompt": prompt}) as response:
+        if response.status != 200:
+            raise HTTPException(500, "Prompt normalization failed")
+        normalized_prompt = await response.json()
+
+    if template_version:
+        await normalization_cache.put(prompt, template_version, normalized_prompt)
+    return normalized_prompt
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "analysis": analysis_cache.stats(),
+        "normalization": normalization_cache.stats()
+    }
+
+async def run_pipeline(content: bytes, filename: str, content_type: str, prompt: str,
+    include_mask: bool = False, debug: bool = False, listener: Optional[StageListener] = None) -> Dict:
+    """Run the whole screenshot pipeline and build the /process-image response.
+
+    Shared by the synchronous endpoint and background jobs; `listener` receives
+    stage progress.
+    """
     image_hash = await get_image_hash(content)
+    current_screenshot.set(content)
     
-    cached_result = await cache_collection.find_one({"image_hash": image_hash})
-    if cached_result:
-        mask_result = cached_result["result"]
-    else:
-        async with aiohttp.ClientSession() as session:
+    graph = StageGraph(listener)
+
+    async def load_cached_mask() -> Optional[Dict]:
+        # Results cached before crop transports existed carry inline crops.
+        transport = CROP_TRANSPORT if CROP_TRANSPORT != "inline" else {"$in": [None, "inline"]}
+        cached_result = await cache_collection.find_one({"image_hash": image_hash, "crop_transport": transport})
+        return cached_result["result"] if cached_result else None
+
+    async def store_image() -> Optional[str]:
+        # A cached mask result can outlive its blob, so the upload is stored (or its expiry refreshed) every time.
+        if CROP_TRANSPORT != "ref":
+            return None
+        return await blob_store.put(content)
+
+    async def generate_mask() -> Dict:
+        def build_form() -> aiohttp.FormData:
             form = aiohttp.FormData()
-            form.add_field('file', BytesIO(content), filename=file.filename, content_type=file.content_type)
-            
-            async with session.post(MASK_API_URL, data=form) as response:
-                if response.status != 200:
-                    raise HTTPException(500, "Mask generation failed")
-                mask_result = await response.json()
-                print(f"Sections from mask-generation: {len(mask_result['sections'])}")
-                
+            form.add_field('file', BytesIO(content), filename=filename, content_type=content_type)
+            return form
+
+        async with upstream.post(MASK_API_URL, data_factory=build_form, params={"images": MASK_IMAGE_MODE}) as response:
+            if response.status != 200:
+                raise HTTPException(500, "Mask generation failed")
+            mask_result = await response.json()
+            print(f"Sections from mask-generation: {len(mask_result['sections'])}")
+
+        await cache_collection.insert_one({
+            "image_hash": image_hash,
+            "result": mask_result,
+            "crop_transport": CROP_TRANSPORT,
+            "created_at": datetime.utcnow()
+        })
+        return mask_result
+
+    async def run_sections(cached_mask: Optional[Dict], image_ref: Optional[str]) -> Tuple[Dict, Dict]:
+        if cached_mask is None and MASK_STREAMING:
+            events = stream_mask_events(content, filename, content_type)
+            mask_result, cacheable_result, process_result = await process_section_stream(events, graph.get("normalize"))
+            print(f"Sections from mask-generation: {len(mask_result['sections'])}")
             await cache_collection.insert_one({
                 "image_hash": image_hash,
-                "result": mask_result,
+                "result": cacheable_result,
+                "crop_transport": CROP_TRANSPORT,
                 "created_at": datetime.utcnow()
             })
+            return mask_result, process_result
 
-    async with aiohttp.ClientSession() as session:
-        normalize_data = {"prompt": prompt}
-        async with session.post(QWEN_API_NORMALIZE_URL, json=normalize_data) as response:
-            if response.status != 200:
-                raise HTTPException(500, "Prompt normalization failed")
-            normalized_prompt = await response.json()
+        mask_result = cached_mask
+        if mask_result is None:
+            async with graph.span("mask_generation"):
+                mask_result = await generate_mask()
+        process_result = await process_sections(mask_result, await graph.get("normalize"))
+        return mask_result, process_result
 
-    process_result = await process_sections(mask_result, normalized_prompt)
+    async def run_match(sections_result: Tuple[Dict, Dict], normalized_prompt: Dict):
+        mask_result, process_result = sections_result
+        filtered_ids = process_result["filtered_section_ids"]
+        # In prefilter order, which is score order when PREFILTER_TOP_K ranks the sections.
+        sections_by_id = {s["id"]: s for s in mask_result["sections"]}
+        filtered_sections = [sections_by_id[section_id] for section_id in filtered_ids]
+        children = await collect_children_for_matching(filtered_sections)
+        final_match, match_rounds = await tournament_match(children, normalized_prompt)
+        return children, final_match, match_rounds
+
+    graph.add("normalize", lambda: normalize_prompt(prompt))
+    graph.add("mask_cache", load_cached_mask)
+    graph.add("image_ref", store_image)
+    graph.add("sections", run_sections, "mask_cache", "image_ref")
+    graph.add("match", run_match, "sections", "normalize")
+    results = await graph.run()
+
+    mask_result, process_result = results["sections"]
+    children, final_match, match_rounds = results["match"]
     filtered_ids = process_result["filtered_section_ids"]
     analyzed_ids = process_result["analyzed_section_ids"]
     
-    filtered_sections = [s for s in mask_result["sections"] if s["id"] in filtered_ids]
-    children = await collect_children_for_matching(filtered_sections)
-    
-    initial_matches = await do_initial_matches(children, normalized_prompt)
-    final_match = await reduce_matches(initial_matches, normalized_prompt)
-    
     response = {
         "filtered_section_ids": filtered_ids,
         "children_count": len(children),
@@ -389,8 +751,39 @@ async def process_image(file: UploadFile = File(...), prompt: str = Form(...),
             if section["id"] in analyzed_ids:
                 analyzed_sections.append(prepare_section_for_json(section))
         response["debug"] = analyzed_sections
+        response["match_rounds"] = match_rounds
+        response["timings"] = graph.timings
         
     if include_mask:
         response["mask_result"] = prepare_mask_result_for_json(mask_result)
         
-    return response
\ No newline at end of file
+    return response
+
+job_runner = JobRunner(job_store, run_pipeline, JOB_CONCURRENCY, JOB_MAX_PENDING)
+
+@app.post("/process-image")
+async def process_image(file: UploadFile = File(...), prompt: str = Form(...),
+    include_mask: bool = Query(False), debug: bool = Query(False)):
+    content = await file.read()
+    return await run_pipeline(content, file.filename, file.content_type, prompt, include_mask, debug)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), prompt: str = Form(...),
+    include_mask: bool = Query(False), debug: bool = Query(False)):
+    content = await file.read()
+    try:
+        job_id = await job_runner.submit(
+            prompt, await get_image_hash(content),
+            content=content, filename=file.filename, content_type=file.content_type,
+            include_mask=include_mask, debug=debug
+        )
+    except JobQueueFull as e:
+        raise HTTPException(429, f"Too many pending jobs: {e}")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
\ No newline at end of file
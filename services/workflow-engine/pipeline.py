@@ -0,0 +1,78 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from telemetry import observe_stage
+
+# Called with (stage name, "running" | "done" | "failed", timing or None)
+StageListener = Callable[[str, str, Optional[Dict[str, float]]], Awaitable[None]]
+
+class StageGraph:
+    """Runs async stages as soon as their dependencies are done.
+
+    Every stage starts as a task when it is added. A stage waits only on the
+    stages it names as dependencies and receives their results as arguments.
+    Stages that need another result only part of the way through can
+    `await graph.get(name)` at that point instead. Start offsets and durations
+    are recorded per stage, relative to graph creation. An optional `listener`
+    is awaited whenever a stage or span starts and ends, for progress reporting.
+    Every duration is also recorded in the stage histogram.
+    """
+
+    def __init__(self, listener: Optional[StageListener] = None):
+        self.started_at = time.perf_counter()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.listener = listener
+
+    async def _notify(self, name: str, state: str):
+        if self.listener is not None:
+            await self.listener(name, state, self.timings.get(name))
+
+    def _record(self, name: str, start: float, failed: bool = False):
+        duration = time.perf_counter() - start
+        observe_stage(name, duration, failed)
+        self.timings[name] = {
+            "start": round(start - self.started_at, 3),
+            "duration": round(duration, 3)
+        }
+
+    @asynccontextmanager
+    async def _track(self, name: str):
+        start = time.perf_counter()
+        await self._notify(name, "running")
+        try:
+            yield
+        except BaseException:
+            self._record(name, start, failed=True)
+            await self._notify(name, "failed")
+            raise
+        self._record(name, start)
+        await self._notify(name, "done")
+
+    def add(self, name: str, fn: Callable[..., Awaitable], *deps: str):
+        async def run():
+            results = [await self.tasks[dep] for dep in deps]
+            async with self._track(name):
+                return await fn(*results)
+
+        self.tasks[name] = asyncio.create_task(run())
+
+    def get(self, name: str) -> asyncio.Task:
+        return self.tasks[name]
+
+    @asynccontextmanager
+    async def span(self, name: str):
+        """Record the timing of a step inside a stage."""
+        async with self._track(name):
+            yield
+
+    async def run(self) -> Dict:
+        try:
+            await asyncio.gather(*self.tasks.values())
+        except BaseException:
+            for task in self.tasks.values():
+                task.cancel()
+            raise
+        return {name: task.result() for name, task in self.tasks.items()}
@@ -0,0 +1,89 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+TRACE_HEADER = "X-Trace-Id"
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+# Trace id of the request being handled, adopted from the caller's X-Trace-Id header
+trace_id: ContextVar[str] = ContextVar("trace_id", default="")
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, including streamed bodies",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Duration of pipeline stages", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("stage_errors_total", "Pipeline stages that raised", ["stage"])
+
+def observe_stage(stage: str, seconds: float, failed: bool = False):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if failed:
+        STAGE_ERRORS.labels(stage).inc()
+
+@contextmanager
+def span(stage: str):
+    """Time a block as `stage`; usable around awaits as well as in worker threads."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe_stage(stage, time.perf_counter() - start, failed=True)
+        raise
+    observe_stage(stage, time.perf_counter() - start)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+class TraceMiddleware:
+    """Per-request trace id and latency.
+
+    The trace id comes from the X-Trace-Id request header or is generated, is
+    available through `trace_id` while the request runs and is echoed on the
+    response. Latency is recorded per route template, so path parameters do
+    not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self.route_paths:
+            paths = [route.path for route in scope["app"].routes if getattr(route, "endpoint", None) is endpoint]
+            self.route_paths[endpoint] = paths[0] if paths else endpoint.__name__
+        return self.route_paths[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get(TRACE_HEADER)
+        current = incoming or uuid.uuid4().hex
+        token = trace_id.set(current)
+        status = {"code": 500}
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                MutableHeaders(scope=message).append(TRACE_HEADER, current)
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            REQUEST_SECONDS.labels(scope["method"], self._route(scope), str(status["code"])).observe(
+                time.perf_counter() - start
+            )
+            trace_id.reset(token)
@@ -0,0 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from telemetry import TRACE_HEADER, trace_id
+
+RETRY_STATUSES = {502, 503, 504}
+
+class UpstreamPool:
+    """App-lifetime aiohttp sessions, one per upstream host.
+
+    Each upstream gets its own connector, so connection limits and keep-alive
+    are tracked per service. Requests are retried with exponential backoff on
+    connection failures and 502/503/504 responses. The current trace id is
+    forwarded in the X-Trace-Id header.
+    """
+
+    def __init__(self, limits: Dict[str, int], timeout: aiohttp.ClientTimeout, default_limit: int = 16,
+        keepalive_timeout: float = 60.0, retries: int = 2, backoff: float = 0.5):
+        self.limits = limits
+        self.timeout = timeout
+        self.default_limit = default_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def _create_session(self, limit: int) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def start(self):
+        for host, limit in self.limits.items():
+            self.sessions[host] = self._create_session(limit)
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, {}
+        await asyncio.gather(*[session.close() for session in sessions.values()])
+
+    def session_for(self, url: str) -> aiohttp.ClientSession:
+        host = urlparse(url).hostname
+        if host not in self.sessions:
+            self.sessions[host] = self._create_session(self.limits.get(host, self.default_limit))
+        return self.sessions[host]
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, data_factory: Optional[Callable[[], aiohttp.FormData]] = None,
+        **kwargs):
+        """Send a request and yield the response, retrying transient failures.
+
+        Multipart bodies are single-use in aiohttp, so they are passed as
+        `data_factory` and rebuilt for every attempt.
+        """
+        session = self.session_for(url)
+        if trace_id.get():
+            kwargs["headers"] = {**kwargs.get("headers", {}), TRACE_HEADER: trace_id.get()}
+        for attempt in range(self.retries + 1):
+            if data_factory is not None:
+                kwargs["data"] = data_factory()
+            try:
+                response = await session.request(method, url, **kwargs)
+            except aiohttp.ClientConnectionError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            if response.status in RETRY_STATUSES and attempt < self.retries:
+                response.release()
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            break
+
+        try:
+            yield response
+        finally:
+            response.release()
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)